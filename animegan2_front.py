@@ -2,75 +2,90 @@
 import torch
 import cv2
 import numpy as np
-import os
 
-from animegan2_model import Generator
+from model_registry import load_animegan_model
+from batch_scheduler import run_batched
+from crop_utils import mask_bbox, working_size as crop_working_size
+from tiled_inference import stylize_rgb_tiled
+from metrics import timed
 
 class AnimeGANv2Front:
     def __init__(self, model_path: str = None, device=None):
         # 1. 选择设备
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        # 2. 实例化模型并移动到设备
-        self.model = Generator().to(self.device)
+        # 2. 权重在第一次推理时才加载（前景/背景共用注册表里的同一份）
+        self.model_path = model_path
 
-        # 3. 确定权重文件路径
-        if model_path is None:
-            model_path = os.path.join("checkpoints", "AnimeGANv2_best.pth")
-        if not os.path.isfile(model_path):
-            raise FileNotFoundError(f"找不到权重：{model_path}")
+    @property
+    def model(self):
+        return load_animegan_model(self.model_path, self.device)
 
-        # 4. 加载 checkpoint
-        ckpt = torch.load(model_path, map_location=self.device)
-        state_dict = ckpt.get("state_dict", ckpt)
+    def _forward(self, inp):
+        return run_batched(("animegan", self.model_path), self.model, inp.to(self.device))
 
-        # 5. 统一 key 前缀、子模块名称映射：
-        mapped = {}
-        for k, v in state_dict.items():
-            # 去掉可能的 DataParallel 前缀
-            key = k.replace("module.", "")
-            # net. -> model.
-            key = key.replace("net.", "model.")
-            # block -> conv_block（针对那些 block 层）
-            key = key.replace(".block", ".conv_block")
-            mapped[key] = v
-
-        # 6. 加载到模型
-        missing, unexpected = self.model.load_state_dict(mapped, strict=False)
-        if missing or unexpected:
-            raise RuntimeError(
-                f"加载权重时出现问题，缺少 keys: {missing}, 多余 keys: {unexpected}"
-            )
-
-        self.model.eval()
-
-    def stylize_foreground(self, img_bgr: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    def stylize_foreground(self, img_bgr: np.ndarray, mask: np.ndarray,
+                           stylized_bgr: np.ndarray = None,
+                           crop: bool = False, max_side: int = 512,
+                           working_size: int = None) -> np.ndarray:
+        """
+        crop=True: 只在掩码外接框（带边距）内推理，输入尺寸按裁切区域自适应
+        （长边不超过 max_side），再贴回原图
+        working_size: 指定推理分辨率（长边），按重叠分块推理
+        """
         # 确保 mask 是单通道二值
         if mask.ndim == 3:
             mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
         _, mask_bin = cv2.threshold(mask, 128, 255, cv2.THRESH_BINARY)
 
+        # 传入整图风格化结果（AnimeGANv2Back.stylize_full）时只做合成，不再推理
+        if stylized_bgr is not None:
+            with timed("composite"):
+                return np.where(mask_bin[..., None] > 0, stylized_bgr, img_bgr)
+
+        h, w = img_bgr.shape[:2]
+        x0, y0, x1, y1 = 0, 0, w, h
+        net_size = (256, 256)
+        if crop:
+            box = mask_bbox(mask_bin)
+            if box is None:
+                return img_bgr.copy()
+            x0, y0, x1, y1 = box
+            net_size = crop_working_size(x1 - x0, y1 - y0, max_side=max_side)
+        region = img_bgr[y0:y1, x0:x1]
+        region_mask = mask_bin[y0:y1, x0:x1]
+
         # 裁切前景并转 RGB
-        fg = cv2.bitwise_and(img_bgr, img_bgr, mask=mask_bin)
+        fg = cv2.bitwise_and(region, region, mask=region_mask)
         fg_rgb = cv2.cvtColor(fg, cv2.COLOR_BGR2RGB)
-        h, w = fg_rgb.shape[:2]
-        # Resize 到训练时的输入尺寸
-        fg_resized = cv2.resize(fg_rgb, (256, 256), interpolation=cv2.INTER_CUBIC)
+        rh, rw = fg_rgb.shape[:2]
+        if working_size:
+            stylized_rgb = stylize_rgb_tiled(self._forward, fg_rgb, working_size)
+        else:
+            with timed("preprocess"):
+                # Resize 到网络输入尺寸
+                fg_resized = cv2.resize(fg_rgb, net_size, interpolation=cv2.INTER_CUBIC)
 
-        # 转 tensor，归一化到 [-1,1]
-        inp = torch.from_numpy(fg_resized).float().div(127.5).sub(1.0)
-        inp = inp.permute(2, 0, 1).unsqueeze(0).to(self.device)
+                # 转 tensor，归一化到 [-1,1]
+                inp = torch.from_numpy(fg_resized).float().div(127.5).sub(1.0)
+                inp = inp.permute(2, 0, 1).unsqueeze(0)
 
-        # 推理
-        with torch.no_grad():
-            out = self.model(inp)[0].cpu()
+            # 推理（并发请求会被合并成一个 batch）
+            out = self._forward(inp)[0].cpu()
 
-        # 恢复到图像
-        out_np = out.permute(1, 2, 0).numpy()
-        out_np = ((out_np + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
-        stylized_rgb = cv2.resize(out_np, (w, h), interpolation=cv2.INTER_CUBIC)
+            # 恢复到图像
+            out_np = out.permute(1, 2, 0).numpy()
+            out_np = ((out_np + 1.0) * 127.5).clip(0, 255).astype(np.uint8)
+            stylized_rgb = cv2.resize(out_np, (rw, rh), interpolation=cv2.INTER_CUBIC)
         stylized_bgr = cv2.cvtColor(stylized_rgb, cv2.COLOR_RGB2BGR)
 
-        # 拼回原图
-        inv_mask = cv2.bitwise_not(mask_bin)
-        background = cv2.bitwise_and(img_bgr, img_bgr, mask=inv_mask)
-        return cv2.add(background, stylized_bgr)
+        with timed("composite"):
+            if crop:
+                # 只贴回掩码内的像素，避免裁切框边缘出现接缝
+                result = img_bgr.copy()
+                result[y0:y1, x0:x1] = np.where(region_mask[..., None] > 0, stylized_bgr, region)
+                return result
+
+            # 拼回原图
+            inv_mask = cv2.bitwise_not(region_mask)
+            background = cv2.bitwise_and(region, region, mask=inv_mask)
+            return cv2.add(background, stylized_bgr)
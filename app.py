@@ -1,5 +1,6 @@
 from flask import Flask
-from routes import app_bp
+from routes import app_bp, start_warm_up, preload_for_fork
+from runtime_config import configure_threads
 import os
 
 app = Flask(__name__)
@@ -9,7 +10,21 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 #create menu        
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)  
 
+# models to load at startup, e.g. WARMUP_MODELS=sam,animegan,Hayao
+# everything else is loaded lazily on first request
+app.config['WARMUP_MODELS'] = [
+    name.strip() for name in os.environ.get('WARMUP_MODELS', '').split(',') if name.strip()
+]
+
 app.register_blueprint(app_bp)
+configure_threads()
+
+# PRELOAD_MODELS=1 (set by gunicorn.conf.py): load in the master before the
+# workers fork; a background warm-up thread would not survive the fork
+if os.environ.get('PRELOAD_MODELS') == '1':
+    preload_for_fork(app.config['WARMUP_MODELS'])
+else:
+    start_warm_up(app.config['WARMUP_MODELS'])
 
 if __name__ == '__main__':
     print("SUCCESSFUL! App running at http://127.0.0.1:5000")
@@ -0,0 +1,125 @@
+# batch_scheduler.py
+#dynamic request batching for the stylization networks
+
+import os
+import threading
+import time
+
+import torch
+
+from runtime_config import inference_context, prepare_input
+from metrics import timed
+from profiling import is_active as profiling_active
+
+
+class _Request:
+    def __init__(self, inp):
+        self.inp = inp
+        self.output = None
+        self.error = None
+        self.done = False
+        self.leader = False
+        self.event = threading.Event()
+
+
+class InferenceBatcher:
+    """
+    Collects concurrent forward passes on the same model for up to
+    max_wait_ms, stacks inputs of equal shape into one batch, runs the
+    model once and hands every caller its own slice of the output.
+
+    There is no scheduler thread: the first caller in a window becomes the
+    leader and runs the batch; callers left over past max_batch promote
+    the next one in line.
+    """
+    def __init__(self, max_batch=8, max_wait_ms=5.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queues = {}
+        self._cond = threading.Condition()
+
+    def run(self, key, model, inp):
+        """
+        :param key: identifies the model, e.g. ("cartoon", "Hayao")
+        :param inp: (1, C, H, W) tensor
+        :return: (1, ...) output tensor for this input
+        """
+        # a profiled request runs on its own thread so the profiler sees its ops
+        if self.max_batch <= 1 or profiling_active():
+            with inference_context():
+                return model(prepare_input(inp))
+
+        item = _Request(inp)
+        with self._cond:
+            queue = self._queues.setdefault(key, [])
+            queue.append(item)
+            if len(queue) == 1:
+                item.leader = True
+            elif len(queue) >= self.max_batch:
+                self._cond.notify_all()
+
+        while True:
+            if item.leader:
+                item.leader = False
+                item.event.clear()
+                self._lead(key, model)
+            item.event.wait()
+            if item.done:
+                break
+
+        if item.error is not None:
+            raise item.error
+        return item.output
+
+    def _lead(self, key, model):
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            queue = self._queues[key]
+            while len(queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = queue[:self.max_batch]
+            del queue[:self.max_batch]
+            if queue:
+                queue[0].leader = True
+                queue[0].event.set()
+        self._execute(model, batch)
+
+    @staticmethod
+    def _execute(model, batch):
+        groups = {}
+        for item in batch:
+            sig = (tuple(item.inp.shape[1:]), item.inp.dtype, item.inp.device)
+            groups.setdefault(sig, []).append(item)
+
+        for items in groups.values():
+            try:
+                with inference_context():
+                    out = model(prepare_input(torch.cat([it.inp for it in items], dim=0)))
+                for i, it in enumerate(items):
+                    it.output = out[i:i + 1]
+            except Exception as e:
+                for it in items:
+                    it.error = e
+            for it in items:
+                it.done = True
+                it.event.set()
+
+
+# INFERENCE_MAX_BATCH=1 (the default) runs every request on its own
+inference_batcher = InferenceBatcher(
+    max_batch=int(os.environ.get("INFERENCE_MAX_BATCH", "1")),
+    max_wait_ms=float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5")),
+)
+
+
+# module names for metrics and profiles, by registry key family
+MODULE_NAMES = {"animegan": "Generator", "cartoon": "Transformer", "cartoon_gray": "Transformer"}
+
+
+def run_batched(key, model, inp):
+    # includes the time spent waiting for a batch to fill
+    with timed("inference", model=MODULE_NAMES.get(key[0], key[0])):
+        return inference_batcher.run(key, model, inp)
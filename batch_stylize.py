@@ -0,0 +1,297 @@
+# batch_stylize.py
+#offline batch stylization: decode -> stylize -> encode/write as a streaming
+#pipeline of thread stages joined by bounded queues, so decoding, inference
+#and writing overlap and memory stays flat however many images there are
+#
+#  python batch_stylize.py photos/ out/ --style Hayao --stylePart background
+#  python batch_stylize.py manifest.csv out/ --style AnimeGAN --stylePart foreground
+#
+#a manifest is a CSV of "image,mask" rows (mask optional) or a .jsonl file of
+#{"image": ..., "mask": ...}; masks may be "x_masks.json#i" references.
+#outputs that already exist are skipped, so an interrupted run can be resumed.
+
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from batch_scheduler import inference_batcher
+from mask_codec import load_mask
+from runtime_config import configure_threads
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+
+_DONE = object()
+
+
+class Task:
+    def __init__(self, image_path, mask_ref, output_path):
+        self.image_path = image_path
+        self.mask_ref = mask_ref
+        self.output_path = output_path
+        self.image = None
+        self.mask = None
+        self.result = None
+
+
+def scan_directory(input_dir, output_dir, mask_dir=None, ext=".png"):
+    """
+    tasks for every image under input_dir (recursively); with mask_dir, the
+    mask for a/b.jpg is mask_dir/a/b_mask.png when that file exists.
+    a/b.jpg is written to output_dir/a/b{ext}, or to a/b.jpg{ext} when
+    another image (a/b.png) has the same stem.
+    """
+    found = []
+    for root, _, files in os.walk(input_dir):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            rel = os.path.relpath(os.path.join(root, name), input_dir)
+            found.append((rel, os.path.splitext(rel)[0]))
+
+    stems = {}
+    for _, stem in found:
+        stems[stem.lower()] = stems.get(stem.lower(), 0) + 1
+
+    tasks = []
+    for rel, stem in found:
+        mask_ref = None
+        if mask_dir:
+            candidate = os.path.join(mask_dir, stem + "_mask.png")
+            mask_ref = candidate if os.path.exists(candidate) else None
+        out_name = rel if stems[stem.lower()] > 1 else stem
+        tasks.append(Task(os.path.join(input_dir, rel), mask_ref, os.path.join(output_dir, out_name + ext)))
+    return tasks
+
+
+def check_unique_outputs(tasks):
+    """:raises ValueError: when two tasks would write the same output file"""
+    seen = {}
+    for task in tasks:
+        key = os.path.normcase(os.path.abspath(task.output_path))
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {task.image_path} both write {task.output_path}")
+        seen[key] = task.image_path
+
+
+def read_manifest(manifest_path, output_dir, ext=".png"):
+    """tasks from a CSV (image[,mask]) or JSON-lines manifest; relative paths are relative to it"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    rows = []
+    with open(manifest_path, newline="") as f:
+        if manifest_path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            for row in csv.reader(f):
+                if not row or row[0].startswith("#") or row[0] == "image":
+                    continue
+                rows.append({"image": row[0], "mask": row[1] if len(row) > 1 and row[1] else None})
+
+    tasks = []
+    for i, row in enumerate(rows):
+        image_path = os.path.join(base, row["image"])
+        mask_ref = os.path.join(base, row["mask"]) if row.get("mask") else None
+        stem = os.path.splitext(os.path.basename(row["image"]))[0]
+        output = row.get("output") or f"{i:06d}_{stem}{ext}"
+        tasks.append(Task(image_path, mask_ref, os.path.join(output_dir, output)))
+    return tasks
+
+
+class Progress:
+    """thread-safe counters with a periodic one-line report"""
+    def __init__(self, total, interval=5.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.skipped = 0
+        self.failed = []
+        self.start = time.perf_counter()
+        self._last = self.start
+        self._lock = threading.Lock()
+
+    def add(self, skipped=False, error=None, path=None):
+        with self._lock:
+            if error is not None:
+                self.failed.append((path, str(error)))
+            elif skipped:
+                self.skipped += 1
+            else:
+                self.done += 1
+            now = time.perf_counter()
+            finished = self.done + self.skipped + len(self.failed)
+            if now - self._last >= self.interval or finished == self.total:
+                self._last = now
+                print(self.line(), flush=True)
+
+    def line(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done - self.skipped - len(self.failed)
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "-"
+        return (f"{self.done + self.skipped + len(self.failed)}/{self.total} "
+                f"(stylized {self.done}, skipped {self.skipped}, failed {len(self.failed)}) "
+                f"{rate:.2f} img/s, eta {eta}")
+
+
+def make_stylizer(style, stylePart, crop=False, working_size=None, quality="full"):
+    from stylize_pipeline import run_stylize
+
+    def stylize(img, mask):
+        if mask is None:
+            # no mask: the whole frame is the stylized part
+            fill = 255 if stylePart == "foreground" else 0
+            mask = np.full(img.shape[:2], fill, np.uint8)
+        elif mask.shape[:2] != img.shape[:2]:
+            mask = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
+        return run_stylize(img, mask, style, stylePart, crop=crop,
+                           working_size=working_size, quality=quality)
+    return stylize
+
+
+def _stage(worker, inbox, outbox, count):
+    """run count threads of worker(item) -> item between two queues"""
+    remaining = [count]
+    lock = threading.Lock()
+
+    def loop():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                # hand the sentinel to a sibling thread; the last one passes it downstream
+                if last:
+                    outbox.put(_DONE)
+                else:
+                    inbox.put(_DONE)
+                return
+            out = worker(item)
+            if out is not None:
+                outbox.put(out)
+
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def run_pipeline(tasks, stylize, decode_workers=4, infer_workers=4, write_workers=2,
+                 queue_size=16, overwrite=False, jpeg_quality=95, progress=None):
+    """
+    stream tasks through decode -> stylize -> write; returns the Progress.
+    infer_workers threads call stylize concurrently, which the shared
+    inference batcher merges into batches when inputs have the same shape.
+    """
+    check_unique_outputs(tasks)
+    progress = progress or Progress(len(tasks))
+    todo, decoded, stylized, finished = (queue.Queue(maxsize=queue_size) for _ in range(4))
+
+    def decode(task):
+        if not overwrite and os.path.exists(task.output_path):
+            progress.add(skipped=True)
+            return None
+        try:
+            task.image = cv2.imread(task.image_path, cv2.IMREAD_COLOR)
+            if task.image is None:
+                raise ValueError(f"cannot decode image: {task.image_path}")
+            if task.mask_ref:
+                task.mask = load_mask(task.mask_ref)
+                if task.mask is None:
+                    raise ValueError(f"cannot read mask: {task.mask_ref}")
+        except Exception as e:
+            progress.add(error=e, path=task.image_path)
+            return None
+        return task
+
+    def infer(task):
+        try:
+            task.result = stylize(task.image, task.mask)
+        except Exception as e:
+            progress.add(error=e, path=task.image_path)
+            return None
+        task.image = task.mask = None
+        return task
+
+    def write(task):
+        path = task.output_path
+        root, ext = os.path.splitext(path)
+        tmp = f"{root}.part{ext}"
+        params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if ext.lower() in (".jpg", ".jpeg") else []
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if not cv2.imwrite(tmp, task.result, params):
+                raise IOError(f"cannot write {path}")
+            # rename last so a killed run never leaves a truncated output behind
+            os.replace(tmp, path)
+        except Exception as e:
+            progress.add(error=e, path=task.image_path)
+            return None
+        task.result = None
+        progress.add()
+        return None
+
+    threads = (_stage(decode, todo, decoded, decode_workers)
+               + _stage(infer, decoded, stylized, infer_workers)
+               + _stage(write, stylized, finished, write_workers))
+    for task in tasks:
+        todo.put(task)
+    todo.put(_DONE)
+    for t in threads:
+        t.join()
+    return progress
+
+
+if __name__ == "__main__":
+    from stylize_pipeline import CARTOON_STYLES
+
+    parser = argparse.ArgumentParser(description="stylize a directory or manifest of images")
+    parser.add_argument("input", help="image directory, or a .csv / .jsonl manifest")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("--style", default="Hayao", help=f"{', '.join(CARTOON_STYLES)} or AnimeGAN")
+    parser.add_argument("--stylePart", default="background", choices=["foreground", "background"])
+    parser.add_argument("--mask-dir", default=None, help="per-image <name>_mask.png masks (directory input)")
+    parser.add_argument("--ext", default=".png", help="output extension, e.g. .png or .jpg")
+    parser.add_argument("--crop", action="store_true", help="foreground: infer on the mask bounding box")
+    parser.add_argument("--working-size", type=int, default=None)
+    parser.add_argument("--quality", default="full", choices=["full", "balanced", "fast"])
+    parser.add_argument("--batch", type=int, default=4, help="max images per network forward")
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--write-workers", type=int, default=2)
+    parser.add_argument("--overwrite", action="store_true", help="redo outputs that already exist")
+    args = parser.parse_args()
+
+    configure_threads()
+    # one inference thread per batch slot so the batcher can fill a batch
+    inference_batcher.max_batch = args.batch
+
+    if os.path.isdir(args.input):
+        tasks = scan_directory(args.input, args.output, args.mask_dir, args.ext)
+    else:
+        tasks = read_manifest(args.input, args.output, args.ext)
+    print(f"{len(tasks)} images, style {args.style}, {args.stylePart}", flush=True)
+
+    stylize = make_stylizer(args.style, args.stylePart, crop=args.crop,
+                            working_size=args.working_size, quality=args.quality)
+    progress = run_pipeline(
+        tasks, stylize,
+        decode_workers=args.decode_workers,
+        infer_workers=max(1, args.batch),
+        write_workers=args.write_workers,
+        overwrite=args.overwrite,
+    )
+    print(f"finished in {time.perf_counter() - progress.start:.1f}s")
+    if progress.failed:
+        failed_log = os.path.join(args.output, "failed.txt")
+        os.makedirs(args.output, exist_ok=True)
+        with open(failed_log, "w") as f:
+            for path, error in progress.failed:
+                f.write(f"{path}\t{error}\n")
+        print(f"{len(progress.failed)} failures listed in {failed_log}")
+        raise SystemExit(1)
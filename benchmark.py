@@ -0,0 +1,269 @@
+# benchmark.py
+#latency / throughput / peak-memory benchmark of the segmentation and
+#stylization hot paths on synthetic images, with randomly initialized
+#weights (no checkpoints or network needed)
+#
+#  python benchmark.py --sizes 512x512,1024x768 --repeat 5 --save bench.json
+#  python benchmark.py --baseline bench.json          # exit 1 on regression
+
+import argparse
+import json
+import os
+import platform
+import resource
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from model_registry import registry
+from runtime_config import configure_threads, prepare_model, MODEL_BACKEND, MODEL_PRECISION
+
+DEFAULT_SIZES = "512x512,1024x768"
+STYLE = "Hayao"
+
+
+def use_random_weights(seed=0):
+    """register randomly initialized models under the keys the loaders use"""
+    torch.manual_seed(seed)
+    if MODEL_BACKEND.get("animegan", "eager") == "eager":
+        from animegan2_model import Generator
+        path = os.path.abspath(os.path.join("checkpoints", "AnimeGANv2_best.pth"))
+        registry.get(("animegan", path, "cpu"),
+                     lambda: prepare_model(Generator(), "animegan"))
+    if MODEL_BACKEND.get("cartoon", "eager") == "eager":
+        from CartoonGAN_Test.network.Transformer import Transformer
+        registry.get(("cartoon", STYLE), lambda: prepare_model(Transformer(), "cartoon"))
+    if MODEL_BACKEND.get("sam", "eager") == "eager":
+        from segment_anything import sam_model_registry
+        registry.get(("sam", "vit_b", "cpu"),
+                     lambda: prepare_model(sam_model_registry["vit_b"](checkpoint=None), "sam"))
+
+
+def synthetic_image(width, height, seed=0):
+    """smooth colour field with a few solid shapes, closer to a photo than noise"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(6):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(min(width, height) // 20, min(width, height) // 5))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.circle(img, center, radius, color, -1)
+    return img
+
+
+def synthetic_mask(width, height):
+    mask = np.zeros((height, width), np.uint8)
+    cv2.ellipse(mask, (width // 2, height // 2), (width // 4, height // 3), 0, 0, 360, 255, -1)
+    return mask
+
+
+class PeakMemory:
+    """samples the process RSS on a background thread and keeps the peak"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # no procfs: fall back to the (monotonic) lifetime peak
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = self.rss()
+        self.peak = self.start
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+
+def build_stages(workdir):
+    """
+    name -> setup(img, mask, path) returning a zero-argument callable.
+    Setup work (decoding, encoding for the decode stages) is not timed.
+    """
+    from sam_func import SAMSegmentor
+    from stylize_back import cartoon_effect
+    from stylize_front import cartoonize_foreground
+    from animegan2_front import AnimeGANv2Front
+    from animegan2_back import AnimeGANv2Back
+
+    labels = [1, 0]
+
+    def prompt_points(img):
+        h, w = img.shape[:2]
+        return [[w // 2, h // 2], [w // 10, h // 10]]
+
+    def sam_load_image(img, mask, path):
+        # cache_size=0: every call runs the image encoder
+        segmentor = SAMSegmentor(device="cpu", cache_size=0)
+        return lambda: segmentor.load_image(path)
+
+    def sam_segment_all_masks(img, mask, path):
+        segmentor = SAMSegmentor(device="cpu", cache_size=1)
+        segmentor.load_image(path)
+        pts = prompt_points(img)
+        return lambda: segmentor.segment_all_masks(pts, labels)
+
+    def sam_export_masks(img, mask, path):
+        segmentor = SAMSegmentor(device="cpu", cache_size=1)
+        segmentor.load_image(path)
+        masks, _ = segmentor.segment_all_masks(prompt_points(img), labels)
+        out = os.path.join(workdir, "masks")
+        return lambda: segmentor.export_multiple_masks(masks, out, "bench")
+
+    def cartoon_effect_stage(img, mask, path):
+        return lambda: cartoon_effect(img, mask, STYLE)
+
+    def cartoonize_foreground_stage(img, mask, path):
+        return lambda: cartoonize_foreground(img, mask, STYLE)
+
+    def animegan_front(img, mask, path):
+        model = AnimeGANv2Front(device="cpu")
+        return lambda: model.stylize_foreground(img, mask)
+
+    def animegan_back(img, mask, path):
+        model = AnimeGANv2Back(device="cpu")
+        return lambda: model.stylize_background(img, mask)
+
+    return {
+        "sam_load_image": sam_load_image,
+        "sam_segment_all_masks": sam_segment_all_masks,
+        "sam_export_masks": sam_export_masks,
+        "cartoon_effect": cartoon_effect_stage,
+        "cartoonize_foreground": cartoonize_foreground_stage,
+        "animegan_front": animegan_front,
+        "animegan_back": animegan_back,
+    }
+
+
+def measure(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    times = []
+    with PeakMemory() as mem:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    ms = np.array(times) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "throughput_per_s": float(len(ms) / (ms.sum() / 1000.0)),
+        "peak_rss_mb": mem.peak / 2 ** 20,
+        "peak_rss_delta_mb": (mem.peak - mem.start) / 2 ** 20,
+        "repeat": repeat,
+    }
+
+
+def run(sizes, stages, repeat=5, warmup=1):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        available = build_stages(workdir)
+        for width, height in sizes:
+            img = synthetic_image(width, height)
+            mask = synthetic_mask(width, height)
+            path = os.path.join(workdir, f"bench_{width}x{height}.png")
+            cv2.imwrite(path, img)
+            for name in stages:
+                fn = available[name](img, mask, path)
+                row = {"stage": name, "size": f"{width}x{height}"}
+                row.update(measure(fn, repeat, warmup))
+                results.append(row)
+                print(f"{name:24s} {row['size']:>10s}  p50 {row['p50_ms']:9.1f} ms  "
+                      f"p90 {row['p90_ms']:9.1f} ms  {row['throughput_per_s']:7.2f}/s  "
+                      f"peak {row['peak_rss_mb']:7.0f} MB (+{row['peak_rss_delta_mb']:.0f})",
+                      flush=True)
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "opencv": cv2.__version__,
+        "threads": torch.get_num_threads(),
+        "machine": platform.machine(),
+        "model_precision": MODEL_PRECISION,
+        "model_backend": MODEL_BACKEND,
+    }
+
+
+def compare(results, baseline, tolerance=0.15):
+    """
+    compare p50 latency against a saved run; returns the rows that got
+    slower than baseline * (1 + tolerance)
+    """
+    before = {(r["stage"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = before.get((r["stage"], r["size"]))
+        if old is None:
+            continue
+        ratio = r["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        flag = "REGRESSION" if ratio > 1 + tolerance else ("faster" if ratio < 1 - tolerance else "")
+        print(f"{r['stage']:24s} {r['size']:>10s}  {old['p50_ms']:9.1f} -> {r['p50_ms']:9.1f} ms  "
+              f"x{ratio:5.2f}  {flag}")
+        if flag == "REGRESSION":
+            regressions.append(r)
+    return regressions
+
+
+def parse_sizes(spec):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in spec.split(",") if item]
+
+
+if __name__ == "__main__":
+    stage_names = list(build_stages(tempfile.gettempdir()))
+    parser = argparse.ArgumentParser(description="benchmark segmentation and stylization stages")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated WxH list")
+    parser.add_argument("--stages", default=",".join(stage_names))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--save", default=None, help="write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare against a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed p50 slowdown before a stage counts as a regression")
+    args = parser.parse_args()
+
+    configure_threads()
+    use_random_weights()
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(stage_names)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = run(parse_sizes(args.sizes), stages, args.repeat, args.warmup)
+    report = {"environment": environment(), "results": results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
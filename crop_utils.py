@@ -0,0 +1,36 @@
+# crop_utils.py
+#helpers for running the stylizers on just the masked subject
+
+import numpy as np
+
+
+def mask_bbox(mask_bin, pad_ratio=0.1, min_pad=8):
+    """
+    padded bounding box of the non-zero pixels of a mask
+    :return: (x0, y0, x1, y1) clipped to the image, or None for an empty mask
+    """
+    ys = np.flatnonzero(mask_bin.any(axis=1))
+    xs = np.flatnonzero(mask_bin.any(axis=0))
+    if len(xs) == 0:
+        return None
+    h, w = mask_bin.shape[:2]
+    x0, x1 = xs[0], xs[-1] + 1
+    y0, y1 = ys[0], ys[-1] + 1
+    pad = max(min_pad, int(max(x1 - x0, y1 - y0) * pad_ratio))
+    return max(0, x0 - pad), max(0, y0 - pad), min(w, x1 + pad), min(h, y1 + pad)
+
+
+def working_size(w, h, max_side=512, min_side=256, multiple=4):
+    """
+    network input size (w, h) for a w x h crop: keeps the aspect ratio, never
+    upsamples the long side past min_side nor exceeds max_side, and rounds to
+    a multiple of the generators' total stride
+    """
+    long_side = max(w, h)
+    target = min(max_side, max(min_side, long_side))
+    scale = target / float(long_side)
+
+    def snap(v):
+        return max(multiple, int(round(v * scale / multiple)) * multiple)
+
+    return snap(w), snap(h)
@@ -0,0 +1,46 @@
+# frame_cache.py
+#in-memory cache of whole stylized frames per (image, style, pipeline),
+#so trying another mask or switching foreground/background only re-composites
+
+import threading
+from collections import OrderedDict
+
+from metrics import cache_lookup
+
+
+class FrameCache:
+    """
+    LRU of stylized frames bounded by total array bytes. Concurrent misses on
+    the same key wait for the first computation instead of repeating it.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                cache_lookup("frame", True)
+                return self._frames[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._frames:
+                    cache_lookup("frame", True)
+                    return self._frames[key]
+            cache_lookup("frame", False)
+
+            frame = compute()
+            with self._lock:
+                self._frames[key] = frame
+                self._total += frame.nbytes
+                while self._total > self.max_bytes and len(self._frames) > 1:
+                    _, old = self._frames.popitem(last=False)
+                    self._total -= old.nbytes
+                self._key_locks.pop(key, None)
+            return frame
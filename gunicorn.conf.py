@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# preload-then-fork deployment:
+#   WARMUP_MODELS=sam,animegan,Hayao gunicorn -c gunicorn.conf.py app:app
+# the master imports app.py once, loads the models listed in WARMUP_MODELS
+# and the forked workers share those weights copy-on-write.
+import os
+
+os.environ.setdefault("PRELOAD_MODELS", "1")
+
+bind = os.environ.get("BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("WORKERS", "2"))
+threads = int(os.environ.get("THREADS", "4"))
+preload_app = True
+timeout = 300
+
+
+def post_fork(server, worker):
+    # split the cores between workers unless INFERENCE_THREADS says otherwise
+    from runtime_config import configure_threads, INFERENCE_THREADS
+    configure_threads(INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // workers))
@@ -0,0 +1,195 @@
+# image_store.py
+#decode-once handling of uploaded images: uploads are streamed to disk while
+#being hashed, dimensions come from the file header, and the decoded array
+#(plus derived copies such as the RGB view) is shared by segmentation and
+#stylization from a bounded in-memory LRU
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from metrics import timed, cache_lookup
+
+CHUNK_SIZE = 1024 * 1024
+# enough for the size fields of JPEG (SOF after EXIF), PNG and GIF headers
+HEADER_BYTES = 256 * 1024
+
+
+def header_size(head, path=None):
+    """
+    (width, height) from the first bytes of an image file without decoding
+    pixels; falls back to opening the file lazily when the header is longer
+    """
+    try:
+        with Image.open(io.BytesIO(head)) as image:
+            return image.size
+    except Exception:
+        if path is None:
+            raise
+    with Image.open(path) as image:
+        return image.size
+
+
+def _frozen(array):
+    # shared between requests: nobody may modify it in place
+    array.flags.writeable = False
+    return array
+
+
+class StoredImage:
+    """
+    One decoded image: read-only BGR pixels, the content digest (sha256 of
+    the file bytes) and lazily derived copies cached alongside.
+    """
+    def __init__(self, bgr, digest):
+        self.bgr = _frozen(bgr)
+        self.digest = digest
+        self.size = (bgr.shape[1], bgr.shape[0])
+        self._derived = {}
+        self._lock = threading.Lock()
+        self.on_grow = None
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return self.bgr.nbytes + sum(a.nbytes for a in self._derived.values())
+
+    def derived(self, name, compute):
+        """compute(bgr) run once per name and kept with the image, read-only"""
+        with self._lock:
+            array = self._derived.get(name)
+        if array is not None:
+            return array
+        array = _frozen(np.ascontiguousarray(compute(self.bgr)))
+        with self._lock:
+            array = self._derived.setdefault(name, array)
+        if self.on_grow is not None:
+            self.on_grow()
+        return array
+
+    @property
+    def rgb(self):
+        return self.derived("rgb", lambda bgr: cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+
+
+class ImageStore:
+    """
+    LRU of StoredImage keyed by file path, bounded by total array bytes.
+    Entries are checked against the file's size and mtime, so a re-upload
+    under the same name is decoded again. Concurrent first loads of a path
+    decode it once.
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def save_upload(self, stream, path):
+        """
+        write an upload stream (werkzeug FileStorage or file object) to path
+        in chunks, hashing as it goes
+        :return: (width, height, digest)
+        """
+        source = getattr(stream, "stream", stream)
+        hasher = hashlib.sha256()
+        head = b""
+        tmp = f"{path}.{threading.get_ident()}.part"
+        with timed("upload_save"):
+            with open(tmp, "wb") as f:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if len(head) < HEADER_BYTES:
+                        head += chunk[:HEADER_BYTES - len(head)]
+                    hasher.update(chunk)
+                    f.write(chunk)
+            os.replace(tmp, path)
+        digest = hasher.hexdigest()
+        with self._lock:
+            # the old decode of a file with this name is stale now
+            self._items.pop(path, None)
+            self._digests[path] = (self._stamp(path), digest)
+        with timed("image_header"):
+            width, height = header_size(head, path)
+        return width, height, digest
+
+    def get(self, path):
+        """
+        decoded image for path, decoding (once) on a miss
+        :raises ValueError: when the file cannot be decoded
+        """
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._items.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._items.move_to_end(path)
+                cache_lookup("image", True)
+                return entry[1]
+            key_lock = self._key_locks.setdefault(path, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._items.get(path)
+                if entry is not None and entry[0] == stamp:
+                    cache_lookup("image", True)
+                    return entry[1]
+                known = self._digests.get(path)
+            cache_lookup("image", False)
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                with self._lock:
+                    self._key_locks.pop(path, None)
+                raise
+            digest = known[1] if known and known[0] == stamp else hashlib.sha256(data).hexdigest()
+            with timed("image_decode"):
+                bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            del data
+            if bgr is None:
+                with self._lock:
+                    self._key_locks.pop(path, None)
+                raise ValueError(f"cannot decode image: {path}")
+
+            image = StoredImage(bgr, digest)
+            image.on_grow = lambda: self._shrink(keep=path)
+            with self._lock:
+                self._items[path] = (stamp, image)
+                self._digests.pop(path, None)
+                self._key_locks.pop(path, None)
+            self._shrink(keep=path)
+            return image
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(image.nbytes for _, image in self._items.values())
+
+    def _shrink(self, keep=None):
+        with self._lock:
+            total = sum(image.nbytes for _, image in self._items.values())
+            for path in list(self._items):
+                if total <= self.max_bytes:
+                    break
+                if path == keep or len(self._items) == 1:
+                    continue
+                total -= self._items.pop(path)[1].nbytes
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._items
@@ -0,0 +1,86 @@
+# job_queue.py
+#bounded background execution of stylize jobs with in-flight de-duplication
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueue:
+    """
+    Runs jobs on a fixed-size thread pool. Jobs submitted with the same key
+    share one job id: while the first is queued or running, later callers
+    just get its id, and once it has finished its result is served from
+    the last max_results completed jobs instead of being recomputed.
+    Failed jobs are not cached, and neither are finished jobs whose result
+    result_valid(result) rejects (e.g. a cached file deleted since).
+    """
+    def __init__(self, max_workers=2, max_results=128, result_valid=None):
+        self.max_results = max_results
+        self.result_valid = result_valid
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stylize-job")
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """:return: (job_id, reused) where reused is True for a de-duplicated request"""
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is not None and self._reusable(self._jobs[job_id]):
+                self._jobs.move_to_end(job_id)
+                return job_id, True
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "status": "queued",
+                "key": key,
+                "result": None,
+                "error": None,
+                "submitted": time.time(),
+            }
+            self._by_key[key] = job_id
+            self._trim()
+
+        self._pool.submit(self._run, job_id, fn, args, kwargs)
+        return job_id, False
+
+    def _reusable(self, job):
+        if job["status"] == "error":
+            return False
+        if job["status"] == "done" and self.result_valid is not None:
+            return self.result_valid(job["result"])
+        return True
+
+    def _run(self, job_id, fn, args, kwargs):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = "running"
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                job.update(status="error", error=str(e), finished=time.time())
+            return
+        with self._lock:
+            job.update(status="done", result=result, finished=time.time())
+
+    def _trim(self):
+        # only finished jobs are dropped; queued/running ones stay reachable
+        finished = [jid for jid, j in self._jobs.items() if j["status"] in ("done", "error")]
+        for jid in finished[:max(0, len(finished) - self.max_results)]:
+            job = self._jobs.pop(jid)
+            if self._by_key.get(job["key"]) == jid:
+                del self._by_key[job["key"]]
+
+    def status(self, job_id):
+        """copy of the job record (status, result, error), or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if k != "key"}
@@ -0,0 +1,96 @@
+# mask_codec.py
+#compact encodings for binary masks (run-length / packed bits) and a loader
+#that understands every format export_multiple_masks can write
+
+import base64
+import json
+import os
+
+import cv2
+import numpy as np
+
+
+def rle_encode(mask):
+    """
+    row-major run-length encoding of a binary mask
+    :param mask: (h, w) bool/0-1/0-255 array
+    :return: {"size": [h, w], "counts": [n0, n1, ...]}, runs alternate 0/1 starting with 0
+    """
+    flat = np.asarray(mask).astype(bool).ravel()
+    if flat.size == 0:
+        return {"size": list(np.shape(mask)[:2]), "counts": []}
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], change, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat[0]:
+        counts.insert(0, 0)
+    return {"size": list(mask.shape[:2]), "counts": counts}
+
+
+def rle_decode(rle):
+    h, w = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, counts).reshape(h, w)
+
+
+def pack_bits(mask):
+    """bit-packed, base64 encoded mask: {"size": [h, w], "bits": str}"""
+    mask = np.asarray(mask).astype(bool)
+    bits = np.packbits(mask.ravel())
+    return {"size": list(mask.shape[:2]), "bits": base64.b64encode(bits.tobytes()).decode("ascii")}
+
+
+def unpack_bits(packed):
+    h, w = packed["size"]
+    bits = np.frombuffer(base64.b64decode(packed["bits"]), dtype=np.uint8)
+    return np.unpackbits(bits, count=h * w).astype(bool).reshape(h, w)
+
+
+def encode_mask(mask, fmt="rle"):
+    if fmt == "rle":
+        out = rle_encode(mask)
+    elif fmt == "bits":
+        out = pack_bits(mask)
+    else:
+        raise ValueError(f"unknown mask encoding: {fmt}")
+    out["format"] = fmt
+    return out
+
+
+def decode_mask(obj):
+    """bool (h, w) mask from an encode_mask() dict"""
+    if obj.get("format") == "bits":
+        return unpack_bits(obj)
+    return rle_decode(obj)
+
+
+def load_mask(ref):
+    """
+    load one mask as a uint8 0/255 image, like cv2.imread(path, 0)
+    :param ref: "x_mask.png", or "x_masks.json#i" / "x_masks.npz#i" for one
+                entry of a multi-mask file
+    :return: mask or None when missing, unreadable or the index is invalid
+    """
+    path, _, index = ref.partition("#")
+    if not os.path.exists(path):
+        return None
+    try:
+        i = int(index or 0)
+        if i < 0:
+            return None
+        if path.endswith(".json"):
+            with open(path) as f:
+                masks = json.load(f)["masks"]
+            mask = decode_mask(masks[i])
+        elif path.endswith(".npz"):
+            with np.load(path) as data:
+                h, w = data["size"]
+                bits = data["bits"][i]
+            mask = np.unpackbits(bits, count=h * w).astype(bool).reshape(h, w)
+        else:
+            return cv2.imread(path, 0)
+    except (IndexError, ValueError, KeyError, OSError):
+        return None
+    return mask.astype(np.uint8) * 255
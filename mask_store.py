@@ -0,0 +1,55 @@
+# mask_store.py
+#in-memory masks handed between /getpoints and /stylize without touching disk
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+
+class MaskStore:
+    """
+    Masks keyed by a random id, kept bit-packed, dropped after ttl seconds
+    or when more than max_items are held (oldest first).
+    """
+    def __init__(self, ttl=600, max_items=256):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, mask):
+        """:param mask: (h, w) binary mask; returns its id"""
+        mask = np.asarray(mask).astype(bool)
+        entry = (time.monotonic(), mask.shape, np.packbits(mask.ravel()))
+        mask_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict()
+            self._items[mask_id] = entry
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return mask_id
+
+    def get(self, mask_id):
+        """uint8 0/255 mask like cv2.imread(path, 0), or None when unknown/expired"""
+        with self._lock:
+            self._evict()
+            entry = self._items.get(mask_id)
+        if entry is None:
+            return None
+        _, (h, w), bits = entry
+        return np.unpackbits(bits, count=h * w).reshape(h, w) * np.uint8(255)
+
+    def _evict(self):
+        deadline = time.monotonic() - self.ttl
+        while self._items:
+            oldest = next(iter(self._items.values()))
+            if oldest[0] >= deadline:
+                break
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,142 @@
+# metrics.py
+#in-process stage timers, counters and gauges, rendered in the Prometheus
+#text format by the /metrics route. Values are per process: under gunicorn
+#every worker keeps (and serves) its own.
+
+import contextlib
+import threading
+import time
+
+from profiling import scope
+
+# seconds; covers a mask composite (~1 ms) up to a CPU SAM encode
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        value = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    """
+    Histograms and counters keyed by (name, sorted labels), plus gauges
+    that are computed when the metrics are rendered.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def value(self, name, **labels):
+        """current value of a counter"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def gauge(self, name, fn, text=None):
+        """
+        register a gauge computed at render time; fn returns a number or a
+        list of (labels dict, number) pairs
+        """
+        self._gauges[name] = fn
+        if text:
+            self._help[name] = text
+
+    @contextlib.contextmanager
+    def timed(self, stage, **labels):
+        # the same region is labelled in a torch profile of the request, if any
+        name = stage + "".join(f"[{v}]" for _, v in sorted(labels.items()))
+        start = time.perf_counter()
+        try:
+            with scope(name):
+                yield
+        finally:
+            self.observe("app_stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def snapshot(self):
+        """histogram count/sum per (name, labels), for tests and debugging"""
+        with self._lock:
+            return {key: (h["count"], h["sum"]) for key, h in self._histograms.items()}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+
+        def header(name, kind, seen):
+            if name in seen:
+                return
+            seen.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        seen = set()
+        for (name, labels), h in sorted(histograms.items()):
+            header(name, "histogram", seen)
+            for bound, count in zip(self.buckets, h["buckets"]):
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', repr(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {h['count']}")
+            lines.append(f"{name}_sum{_label_text(labels)} {h['sum']:.6f}")
+            lines.append(f"{name}_count{_label_text(labels)} {h['count']}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter", seen)
+            lines.append(f"{name}{_label_text(labels)} {value}")
+
+        for name, fn in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            header(name, "gauge", seen)
+            if isinstance(value, (int, float)):
+                lines.append(f"{name} {value}")
+                continue
+            for labels, v in value:
+                lines.append(f"{name}{_label_text(tuple(sorted(labels.items())))} {v}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("app_stage_seconds", "time spent per pipeline stage")
+metrics.describe("app_cache_requests_total", "cache lookups by cache and result (hit/miss)")
+
+
+def timed(stage, **labels):
+    """context manager (or decorator) recording one app_stage_seconds observation"""
+    return metrics.timed(stage, **labels)
+
+
+def cache_lookup(cache, hit):
+    metrics.inc("app_cache_requests_total", cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,232 @@
+# model_export.py
+#export the stylization generators and the SAM mask decoder to TorchScript
+#or ONNX, and load the exported graphs back in place of the eager modules
+#
+#  python model_export.py animegan --backend onnx
+#  python model_export.py cartoon --style Hayao --backend torchscript
+#  python model_export.py sam --backend torchscript
+#
+#then pick the backend per model family, e.g.
+#  MODEL_BACKEND=animegan=onnx,cartoon=torchscript,sam=torchscript
+
+import argparse
+import os
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join("checkpoints", "exported"))
+BACKENDS = ("eager", "torchscript", "onnx")
+EXTENSIONS = {"torchscript": "pt", "onnx": "onnx"}
+
+
+def export_path(name, backend):
+    return os.path.join(EXPORT_DIR, f"{name}.{EXTENSIONS[backend]}")
+
+
+def animegan_export_name(model_path=None):
+    if model_path is None:
+        model_path = os.path.join("checkpoints", "AnimeGANv2_best.pth")
+    return "animegan_" + os.path.splitext(os.path.basename(model_path))[0]
+
+
+def cartoon_export_name(style):
+    return f"cartoon_{style}"
+
+
+def sam_decoder_export_name(model_type, multimask):
+    return f"sam_{model_type}_decoder_{'multi' if multimask else 'single'}"
+
+
+class MaskDecoderGraph(nn.Module):
+    """SAM's mask decoder with multimask_output fixed, so it can be traced"""
+    def __init__(self, mask_decoder, multimask_output):
+        super().__init__()
+        self.mask_decoder = mask_decoder
+        self.multimask_output = multimask_output
+
+    def forward(self, image_embeddings, image_pe, sparse_prompt_embeddings, dense_prompt_embeddings):
+        return self.mask_decoder(
+            image_embeddings=image_embeddings,
+            image_pe=image_pe,
+            sparse_prompt_embeddings=sparse_prompt_embeddings,
+            dense_prompt_embeddings=dense_prompt_embeddings,
+            multimask_output=self.multimask_output,
+        )
+
+
+class OnnxModule:
+    """
+    callable over an ONNX Runtime CPU session that takes and returns torch
+    tensors, so it can stand in for the eager module
+    """
+    def __init__(self, path):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("the onnx backend needs onnxruntime: pip install onnxruntime") from e
+        options = onnxruntime.SessionOptions()
+        threads = torch.get_num_threads()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.path = path
+
+    def __call__(self, *inputs):
+        feed = {
+            name: np.ascontiguousarray(t.detach().cpu().numpy(), dtype=np.float32)
+            for name, t in zip(self.input_names, inputs)
+        }
+        outputs = [torch.from_numpy(o) for o in self.session.run(None, feed)]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+    def eval(self):
+        return self
+
+
+class ExportedMaskDecoder(nn.Module):
+    """
+    drop-in for Sam.mask_decoder backed by two exported graphs, one per
+    multimask_output value (SamPredictor passes it as a python bool)
+    """
+    def __init__(self, single, multi):
+        super().__init__()
+        self.single = single
+        self.multi = multi
+
+    def forward(self, image_embeddings, image_pe, sparse_prompt_embeddings,
+                dense_prompt_embeddings, multimask_output):
+        graph = self.multi if multimask_output else self.single
+        return graph(image_embeddings, image_pe, sparse_prompt_embeddings, dense_prompt_embeddings)
+
+
+def load_exported(name, backend, device="cpu"):
+    """load an exported graph; raises FileNotFoundError if it has not been exported"""
+    path = export_path(name, backend)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"no exported {backend} model at {path}; run python model_export.py first"
+        )
+    if backend == "onnx":
+        return OnnxModule(path)
+    model = torch.jit.load(path, map_location=device)
+    model.eval()
+    return model
+
+
+def load_exported_sam(model, model_type, backend, device="cpu"):
+    """replace a SAM model's mask decoder with the exported graphs"""
+    model.mask_decoder = ExportedMaskDecoder(
+        load_exported(sam_decoder_export_name(model_type, False), backend, device),
+        load_exported(sam_decoder_export_name(model_type, True), backend, device),
+    )
+    return model
+
+
+def export_module(module, example_inputs, name, backend, input_names, output_names, dynamic_axes):
+    """trace a module to TorchScript or ONNX under EXPORT_DIR and return the file path"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_path(name, backend)
+    module.eval()
+    with warnings.catch_warnings():
+        # shape-dependent python scalars in the SAM decoder are constants for a given model
+        warnings.simplefilter("ignore")
+        if backend == "torchscript":
+            with torch.no_grad():
+                traced = torch.jit.trace(module, example_inputs)
+            traced = torch.jit.freeze(traced)
+            traced.save(path)
+        elif backend == "onnx":
+            torch.onnx.export(
+                module, example_inputs, path,
+                input_names=input_names, output_names=output_names,
+                dynamic_axes=dynamic_axes, opset_version=17, dynamo=False,
+            )
+        else:
+            raise ValueError(f"unknown export backend: {backend}")
+    return path
+
+
+def export_image_net(model, name, backend, size=256):
+    """export a (N, 3, H, W) -> (N, 3, H, W) generator with dynamic batch and size"""
+    example = torch.rand(1, 3, size, size) * 2 - 1
+    axes = {0: "batch", 2: "height", 3: "width"}
+    return export_module(
+        model, (example,), name, backend,
+        input_names=["image"], output_names=["stylized"],
+        dynamic_axes={"image": axes, "stylized": axes},
+    )
+
+
+def export_sam_decoder(model, model_type, backend):
+    """export SAM's mask decoder for both multimask settings; returns the two paths"""
+    embed_dim = model.prompt_encoder.embed_dim
+    h, w = model.prompt_encoder.image_embedding_size
+    example = (
+        torch.randn(1, embed_dim, h, w),
+        model.prompt_encoder.get_dense_pe().detach(),
+        torch.randn(2, 3, embed_dim),
+        torch.randn(2, embed_dim, h, w),
+    )
+    axes = {
+        "sparse_prompt_embeddings": {0: "batch", 1: "tokens"},
+        "dense_prompt_embeddings": {0: "batch"},
+        "masks": {0: "batch"},
+        "iou_predictions": {0: "batch"},
+    }
+    return [
+        export_module(
+            MaskDecoderGraph(model.mask_decoder, multimask), example,
+            sam_decoder_export_name(model_type, multimask), backend,
+            input_names=["image_embeddings", "image_pe",
+                         "sparse_prompt_embeddings", "dense_prompt_embeddings"],
+            output_names=["masks", "iou_predictions"],
+            dynamic_axes=axes,
+        )
+        for multimask in (False, True)
+    ]
+
+
+def max_output_diff(reference, exported, inputs):
+    """largest absolute difference between the eager and exported outputs"""
+    with torch.no_grad():
+        ref = reference(*inputs)
+        out = exported(*inputs)
+    if torch.is_tensor(ref):
+        ref, out = (ref,), (out,)
+    return max(float((r - o).abs().max()) for r, o in zip(ref, out))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export models to TorchScript or ONNX")
+    parser.add_argument("family", choices=["animegan", "cartoon", "sam"])
+    parser.add_argument("--backend", default="torchscript", choices=["torchscript", "onnx"])
+    parser.add_argument("--model_path", default=None, help="AnimeGANv2 checkpoint")
+    parser.add_argument("--style", default="Hayao", help="CartoonGAN style")
+    parser.add_argument("--model_type", default="vit_b", help="SAM model type")
+    args = parser.parse_args()
+
+    if args.family == "animegan":
+        from model_registry import build_animegan_model
+        model = build_animegan_model(args.model_path)
+        name = animegan_export_name(args.model_path)
+    elif args.family == "cartoon":
+        from model_registry import build_cartoon_model
+        model = build_cartoon_model(args.style)
+        name = cartoon_export_name(args.style)
+
+    if args.family == "sam":
+        from model_registry import build_sam_model
+        sam = build_sam_model(args.model_type)
+        for path in export_sam_decoder(sam, args.model_type, args.backend):
+            print(f"exported {path}")
+    else:
+        path = export_image_net(model, name, args.backend)
+        check = (torch.rand(1, 3, 320, 192) * 2 - 1,)
+        exported = load_exported(name, args.backend)
+        print(f"exported {path} (max abs diff vs eager at 320x192: "
+              f"{max_output_diff(model, exported, check):.2e})")
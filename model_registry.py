@@ -0,0 +1,297 @@
+# model_registry.py
+#one shared, thread-safe home for every network the app runs
+
+import copy
+import gc
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+
+from runtime_config import prepare_model, MODEL_BACKEND
+from metrics import metrics
+from model_export import (
+    load_exported, load_exported_sam, animegan_export_name, cartoon_export_name
+)
+
+
+def model_nbytes(model):
+    """bytes held by a module's parameters and buffers"""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Loads each model once per key and hands the same instance to every caller.
+    Concurrent first use of a key waits on a per-key lock instead of loading
+    twice. With max_bytes set, least recently used models are dropped when
+    the total goes over the cap (the model just requested is always kept).
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                entry["last_used"] = time.time()
+                entry["hits"] += 1
+                return entry["model"]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    entry["hits"] += 1
+                    return entry["model"]
+
+            start = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start
+            metrics.observe("app_stage_seconds", load_seconds, stage="model_load")
+            entry = {
+                "model": model,
+                "bytes": model_nbytes(model) if isinstance(model, torch.nn.Module) else 0,
+                "load_seconds": load_seconds,
+                "last_used": time.time(),
+                "hits": 0,
+            }
+            with self._lock:
+                self._models[key] = entry
+                self._evict(keep=key)
+            return model
+
+    def _evict(self, keep):
+        if self.max_bytes is None:
+            return
+        total = sum(e["bytes"] for e in self._models.values())
+        for key in list(self._models):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._models.pop(key)["bytes"]
+
+    def evict(self, key):
+        with self._lock:
+            return self._models.pop(key, None) is not None
+
+    def loaded(self):
+        """what is in memory, least recently used first"""
+        with self._lock:
+            return [{
+                "key": list(key) if isinstance(key, tuple) else key,
+                "bytes": e["bytes"],
+                "load_seconds": round(e["load_seconds"], 3),
+                "last_used": e["last_used"],
+                "hits": e["hits"],
+            } for key, e in self._models.items()]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._models
+
+
+    def prepare_for_fork(self):
+        """
+        call in the master process after preloading and before workers fork:
+        freezes the GC so forked workers don't dirty the pages of long-lived
+        objects. Tensor storage is never written by refcounting, so fork
+        already shares the weights copy-on-write.
+        """
+        gc.collect()
+        gc.freeze()
+
+
+# MODEL_MMAP=1 memory-maps checkpoint files instead of reading them into
+# private memory, so every process on the box shares one page-cache copy
+USE_MMAP = os.environ.get("MODEL_MMAP") == "1"
+
+
+def load_weights(path, map_location="cpu"):
+    if USE_MMAP and str(map_location) == "cpu":
+        try:
+            return torch.load(path, map_location="cpu", mmap=True)
+        except RuntimeError:
+            # legacy (non-zip) checkpoints cannot be memory-mapped
+            pass
+    return torch.load(path, map_location=map_location)
+
+
+def apply_state_dict(model, state_dict, strict=True):
+    # assign=True keeps the (possibly memory-mapped) loaded tensors as parameters
+    return model.load_state_dict(state_dict, strict=strict, assign=USE_MMAP)
+
+
+_limit_mb = os.environ.get("MODEL_MEMORY_LIMIT_MB")
+registry = ModelRegistry(max_bytes=int(_limit_mb) * 1024 * 1024 if _limit_mb else None)
+
+
+def checkpoint_version(path):
+    """cheap identity of a weights file (size + mtime) for cache keys"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{st.st_size}-{int(st.st_mtime)}"
+
+
+def cartoon_checkpoint_path(style):
+    return os.path.join(
+        os.path.dirname(__file__),
+        f"CartoonGAN_Test/pretrained_model/{style}_net_G_float.pth"
+    )
+
+
+def build_cartoon_model(style="Hayao"):
+    """load a float32 CartoonGAN Transformer (not registered, no runtime settings)"""
+    # 添加 CartoonGAN 路径
+    sys.path.append(os.path.abspath(
+        os.path.join(os.path.dirname(__file__), 'CartoonGAN_Test')
+    ))
+    from CartoonGAN_Test.network.Transformer import Transformer
+
+    model_path = cartoon_checkpoint_path(style)
+    model = Transformer()
+    state = load_weights(model_path, map_location="cpu")
+    apply_state_dict(model, state)
+    model.eval()
+    return model
+
+
+def build_animegan_model(model_path=None, device="cpu"):
+    """load a float32 AnimeGANv2 Generator (not registered, no runtime settings)"""
+    from animegan2_model import Generator
+
+    # 确定权重文件路径
+    if model_path is None:
+        model_path = os.path.join("checkpoints", "AnimeGANv2_best.pth")
+    if not os.path.isfile(model_path):
+        raise FileNotFoundError(f"找不到权重：{model_path}")
+    model = Generator().to(device)
+
+    # 加载 checkpoint
+    ckpt = load_weights(model_path, map_location=device)
+    state_dict = ckpt.get("state_dict", ckpt)
+
+    # 统一 key 前缀、子模块名称映射：
+    mapped = {}
+    for k, v in state_dict.items():
+        key = k.replace("module.", "")           # 去掉 DataParallel 前缀
+        key = key.replace("net.", "model.")      # net. -> model.
+        key = key.replace(".block", ".conv_block")  # block -> conv_block
+        mapped[key] = v
+
+    # 加载权重，不严格匹配并检查缺失/多余
+    missing, unexpected = apply_state_dict(model, mapped, strict=False)
+    if missing or unexpected:
+        raise RuntimeError(
+            f"加载权重时出现问题，缺少 keys: {missing}, 多余 keys: {unexpected}"
+        )
+    model.eval()
+    return model
+
+
+def build_sam_model(model_type="vit_b", device="cpu"):
+    """load float32 SAM weights, downloading the ViT-B checkpoint on first run"""
+    from segment_anything import sam_model_registry
+
+    checkpoint_dir = os.path.join(os.getcwd(), "checkpoints")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_path = os.path.join(checkpoint_dir, "sam_vit_b_01ec64.pth")
+
+    if not os.path.exists(checkpoint_path):
+        url = "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth"
+        print(f"Downloading model to {checkpoint_path} ...")
+        torch.hub.download_url_to_file(url, checkpoint_path)
+        print("Download complete.")
+
+    model = sam_model_registry[model_type](checkpoint=None)
+    state_dict = load_weights(checkpoint_path, map_location=device)
+    apply_state_dict(model, state_dict)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def load_cartoon_model(style="Hayao"):
+    """CartoonGAN Transformer for one style, shared by the foreground and background paths"""
+    backend = MODEL_BACKEND.get("cartoon", "eager")
+    if backend != "eager":
+        return registry.get(
+            ("cartoon", style, backend),
+            lambda: load_exported(cartoon_export_name(style), backend)
+        )
+    return registry.get(
+        ("cartoon", style),
+        lambda: prepare_model(build_cartoon_model(style), "cartoon")
+    )
+
+
+def fold_gray_input(model):
+    """
+    make a model whose input is one gray channel repeated three times take
+    the single channel instead: the first conv's weights are summed over
+    its input channels, which gives the same output without the copies
+    """
+    conv = next(m for m in model.modules() if isinstance(m, torch.nn.Conv2d))
+    with torch.no_grad():
+        conv.weight = torch.nn.Parameter(conv.weight.sum(dim=1, keepdim=True), requires_grad=False)
+    conv.in_channels = 1
+    return model
+
+
+def load_cartoon_gray_model(style="Hayao"):
+    """
+    load_cartoon_model() taking the 1-channel L input of the cartoon_effect
+    pipelines; None for exported backends, whose graphs can't be changed
+    """
+    if MODEL_BACKEND.get("cartoon", "eager") != "eager":
+        return None
+    return registry.get(
+        ("cartoon_gray", style),
+        lambda: fold_gray_input(copy.deepcopy(load_cartoon_model(style)))
+    )
+
+
+def load_animegan_model(model_path=None, device="cpu"):
+    """AnimeGANv2 Generator, shared by AnimeGANv2Front and AnimeGANv2Back"""
+    if model_path is None:
+        model_path = os.path.join("checkpoints", "AnimeGANv2_best.pth")
+    backend = MODEL_BACKEND.get("animegan", "eager")
+    if backend != "eager":
+        return registry.get(
+            ("animegan", os.path.abspath(model_path), str(device), backend),
+            lambda: load_exported(animegan_export_name(model_path), backend, device)
+        )
+    return registry.get(
+        ("animegan", os.path.abspath(model_path), str(device)),
+        lambda: prepare_model(build_animegan_model(model_path, device), "animegan")
+    )
+
+
+def load_sam_model(model_type="vit_b", device="cpu"):
+    """SAM weights, shared by every SAMImageState"""
+    backend = MODEL_BACKEND.get("sam", "eager")
+    if backend != "eager":
+        # the image encoder stays eager; only the per-prompt mask decoder is exported
+        return registry.get(
+            ("sam", model_type, str(device), backend),
+            lambda: load_exported_sam(
+                prepare_model(build_sam_model(model_type, device), "sam"),
+                model_type, backend, device
+            )
+        )
+    return registry.get(
+        ("sam", model_type, str(device)),
+        lambda: prepare_model(build_sam_model(model_type, device), "sam")
+    )
@@ -0,0 +1,200 @@
+# profiling.py
+#opt-in profiling of single requests: send "profile": true (or the header
+#X-Profile: 1) to /getpoints or /stylize and that request alone runs under
+#cProfile and torch.profiler. The profile is stored under PROFILE_DIR and
+#summarized in the JSON response.
+#
+#  X-Profile: 1 | all      cProfile + torch.profiler
+#  X-Profile: python       cProfile only
+#  X-Profile: torch        torch.profiler only
+#
+#profiling is off unless PROFILE_TOKEN or PROFILING=1 is set. With
+#PROFILE_TOKEN, the header X-Profile-Token must match it; PROFILING=1 alone
+#lets any client profile, so keep it to development servers.
+
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+
+from flask import request, jsonify
+
+# outside static/, which Flask serves to anyone
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILING_ENABLED = bool(PROFILE_TOKEN) or os.environ.get("PROFILING") == "1"
+PROFILE_TOP = 25
+
+MODES = {"1": "all", "true": "all", "yes": "all", "all": "all", "python": "python", "torch": "torch"}
+
+# torch.profiler and cProfile are process-wide; one profiled request at a time
+_profile_lock = threading.Lock()
+_active = threading.local()
+
+
+def is_active():
+    """True while the current thread is running a profiled request"""
+    return getattr(_active, "torch", False)
+
+
+def scope(name):
+    """labelled region in the torch profile (a no-op unless this thread is profiled)"""
+    if not is_active():
+        return contextlib.nullcontext()
+    from torch.profiler import record_function
+    return record_function(name)
+
+
+def authorized():
+    """True when profiling is enabled and the current request may use it"""
+    if not PROFILING_ENABLED:
+        return False
+    return not PROFILE_TOKEN or request.headers.get("X-Profile-Token") == PROFILE_TOKEN
+
+
+def requested_mode(data=None):
+    """profiling mode asked for by the current request, or None"""
+    if not authorized():
+        return None
+    value = request.headers.get("X-Profile")
+    if value is None and isinstance(data, dict):
+        value = data.get("profile")
+    if value is None or value is False:
+        return None
+    return MODES.get(str(value).strip().lower())
+
+
+def _python_summary(profiler, base):
+    profiler.dump_stats(base + ".prof")
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+    with open(base + ".txt", "w") as f:
+        f.write(out.getvalue())
+
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({func})",
+                     "calls": nc, "self_ms": tt * 1000.0, "cumulative_ms": ct * 1000.0})
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:PROFILE_TOP]
+
+
+def _torch_summary(prof, base):
+    prof.export_chrome_trace(base + ".trace.json")
+
+    # operator time attributed to the innermost labelled scope around it
+    # (inference[Generator], inference[Transformer], sam_encode, ...)
+    events = prof.events()
+    scopes = {}
+    by_scope_op = {}
+    for e in events:
+        if e.name.startswith(("aten::", "quantized::", "prim::")):
+            parent = e.cpu_parent
+            while parent is not None and parent.name.startswith(("aten::", "quantized::", "prim::")):
+                parent = parent.cpu_parent
+            owner = parent.name if parent is not None else "(unscoped)"
+            key = (owner, e.name)
+            by_scope_op[key] = by_scope_op.get(key, 0.0) + e.self_cpu_time_total / 1000.0
+        else:
+            scopes[e.name] = scopes.get(e.name, 0.0) + e.cpu_time_total / 1000.0
+
+    ops = sorted(
+        ({"scope": s, "op": op, "self_ms": ms} for (s, op), ms in by_scope_op.items()),
+        key=lambda r: r["self_ms"], reverse=True)[:PROFILE_TOP]
+    scope_rows = sorted(({"scope": s, "total_ms": ms} for s, ms in scopes.items()),
+                        key=lambda r: r["total_ms"], reverse=True)[:PROFILE_TOP]
+
+    with open(base + ".ops.txt", "w") as f:
+        f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=50))
+    return scope_rows, ops
+
+
+def run_profiled(mode, fn, *args, **kwargs):
+    """
+    call fn under the requested profilers
+    :return: (fn's result, profile summary dict); while another request is
+             being profiled, fn runs unprofiled and the summary is an error
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return fn(*args, **kwargs), {"error": "another request is being profiled"}
+    try:
+        profile_id = uuid.uuid4().hex[:12]
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, profile_id)
+        summary = {"id": profile_id, "mode": mode}
+
+        python_prof = cProfile.Profile() if mode in ("all", "python") else None
+        torch_prof = None
+        if mode in ("all", "torch"):
+            from torch.profiler import profile, ProfilerActivity
+            torch_prof = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            if torch_prof is not None:
+                stack.enter_context(torch_prof)
+                _active.torch = True
+                stack.callback(setattr, _active, "torch", False)
+            if python_prof is not None:
+                python_prof.enable()
+                stack.callback(python_prof.disable)
+            result = fn(*args, **kwargs)
+        summary["wall_ms"] = (time.perf_counter() - start) * 1000.0
+
+        files = {}
+        if python_prof is not None:
+            summary["python"] = _python_summary(python_prof, base)
+            files.update(pstats=base + ".prof", python_text=base + ".txt")
+        if torch_prof is not None:
+            summary["scopes"], summary["ops"] = _torch_summary(torch_prof, base)
+            files.update(chrome_trace=base + ".trace.json", ops_table=base + ".ops.txt")
+        summary["files"] = files
+        with open(base + ".json", "w") as f:
+            json.dump(summary, f, indent=1)
+        return result, summary
+    finally:
+        _profile_lock.release()
+
+
+def profiled(view):
+    """
+    route decorator: runs the view under the profilers when the request asks
+    for it and adds the summary to a JSON response as "profile"
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = requested_mode(request.get_json(silent=True))
+        if mode is None:
+            return view(*args, **kwargs)
+
+        response, summary = run_profiled(mode, view, *args, **kwargs)
+        status = None
+        if isinstance(response, tuple):
+            response, status = response[0], response[1]
+        body = response.get_json(silent=True)
+        if not isinstance(body, dict):
+            return response if status is None else (response, status)
+        body["profile"] = summary
+        out = jsonify(body)
+        if "id" in summary:
+            out.headers["X-Profile-Id"] = summary["id"]
+        return out if status is None else (out, status)
+    return wrapper
+
+
+def load_profile(profile_id):
+    """stored summary of an earlier profile, or None"""
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
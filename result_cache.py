@@ -0,0 +1,84 @@
+# result_cache.py
+#content-addressed, size-bounded disk cache of stylized outputs
+
+import hashlib
+import os
+import threading
+
+import cv2
+
+from metrics import timed
+
+
+class ResultCache:
+    """
+    Stylized images stored as {key}.jpg, where key hashes everything the
+    output depends on. Identical requests map to the same file and
+    different ones can never overwrite each other. When the directory
+    grows past max_bytes the least recently used files are deleted.
+    """
+    def __init__(self, cache_dir=os.path.join("static", "results", "cache"), max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+
+    @staticmethod
+    def key(image_hash, mask_hash, style, stylePart, model_version):
+        parts = "|".join([image_hash, mask_hash, style, stylePart, model_version])
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    def get(self, key):
+        """path of a cached result (marked as recently used), or None"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, image):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp.jpg"
+        with timed("imwrite"):
+            ok = cv2.imwrite(tmp, image)
+        if not ok:
+            raise IOError(f"cannot write {path}")
+        size = os.path.getsize(tmp)
+        existed = os.path.exists(path)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_total()
+            elif not existed:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _files(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [e for e in os.scandir(self.cache_dir) if e.is_file() and e.name.endswith(".jpg")
+                and ".tmp" not in e.name]
+
+    def _scan_total(self):
+        return sum(e.stat().st_size for e in self._files())
+
+    def _evict(self, keep):
+        entries = sorted(self._files(), key=lambda e: e.stat().st_mtime)
+        for e in entries:
+            if self._total <= self.max_bytes:
+                break
+            if e.path == keep:
+                continue
+            try:
+                size = e.stat().st_size
+                os.remove(e.path)
+                self._total -= size
+            except OSError:
+                pass
@@ -1,23 +1,169 @@
 import os
-from flask import Blueprint, request, render_template, url_for, current_app, jsonify
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, render_template, url_for, current_app, jsonify, Response
 from werkzeug.utils import secure_filename
-from sam_func import SAMSegmentor
-from PIL import Image
-from stylize_back import cartoon_effect
-from stylize_front import cartoonize_foreground
-import cv2
+from sam_func import SAMSegmentor, render_mask_preview
+from image_store import ImageStore
+from mask_codec import load_mask, encode_mask
+from mask_store import MaskStore
+from model_registry import registry, load_cartoon_model, cartoon_checkpoint_path, checkpoint_version
+from result_cache import ResultCache
+from job_queue import JobQueue
+from stylize_back import QUALITY_PRESETS
+from stylize_pipeline import CARTOON_STYLES, animegan_front, run_stylize
+from frame_cache import FrameCache
+from metrics import metrics, cache_lookup
+from profiling import profiled, load_profile, authorized as profiling_authorized
+from runtime_config import MODEL_PRECISION, MODEL_BACKEND
+
+
+# upper bound for the per-request "working_size" (tiled inference resolution)
+MAX_WORKING_SIZE = int(os.environ.get("MAX_WORKING_SIZE", "2048"))
+# the generators downsample by 4
+MIN_WORKING_SIZE = 4
+
+# bump when the stylize code changes output for the same inputs
+STYLIZE_PIPELINE_VERSION = "1"
+
+result_cache = ResultCache(max_bytes=int(os.environ.get("RESULT_CACHE_MB", "512")) * 1024 * 1024)
+
+# whole stylized frames per (image, style, pipeline); compositing a new mask
+# onto a cached frame needs no inference
+frame_cache = FrameCache(max_bytes=int(os.environ.get("FRAME_CACHE_MB", "256")) * 1024 * 1024)
+
+# background /stylize jobs ("async": true), de-duplicated by content; a
+# finished job is reused only while result_cache still holds its file
+stylize_jobs = JobQueue(max_workers=int(os.environ.get("STYLIZE_WORKERS", "2")),
+                        result_valid=os.path.exists)
 
-from animegan2_front import AnimeGANv2Front
-from animegan2_back import AnimeGANv2Back 
+# function_ upload Images
+app_bp = Blueprint('app', __name__)
 
+segmentor = SAMSegmentor(cache_dir=os.path.join("checkpoints", "sam_cache"),
+                         cache_disk_bytes=int(os.environ.get("SAM_CACHE_MB", "1024")) * 1024 * 1024)
 
-animegan_front = AnimeGANv2Front("checkpoints/AnimeGANv2_best.pth")
-animegan_back = AnimeGANv2Back("checkpoints/AnimeGANv2_best.pth")
+# uploads decoded once and shared by /getpoints, /stylize and mask previews
+image_store = ImageStore(max_bytes=int(os.environ.get("IMAGE_STORE_MB", "512")) * 1024 * 1024)
 
-# function_ upload Images
-app_bp = Blueprint('app', __name__)
+# background image-encoder jobs started at upload time, keyed by the upload's
+# content digest; a job leaves the dict when it finishes (its result is in the
+# embedding cache by then)
+embedding_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sam-embed")
+embedding_jobs = {}
+embedding_jobs_lock = threading.Lock()
+
+
+warmup_status = {"requested": [], "done": True, "errors": {}}
 
-segmentor = SAMSegmentor()  
+
+def load_named_model(name):
+    """load one model by its warm-up name: 'sam', 'animegan' or a CartoonGAN style"""
+    if name == 'sam':
+        return segmentor.model
+    if name == 'animegan':
+        return animegan_front.model
+    if name in CARTOON_STYLES:
+        return load_cartoon_model(name)
+    raise ValueError(f"unknown model name: {name}")
+
+
+def warm_up(names):
+    warmup_status.update({"requested": list(names), "done": False, "errors": {}})
+    for name in names:
+        try:
+            load_named_model(name)
+        except Exception as e:
+            warmup_status["errors"][name] = str(e)
+    warmup_status["done"] = True
+
+
+def preload_for_fork(names):
+    """
+    load models synchronously in a pre-fork master (gunicorn preload_app)
+    so workers inherit them copy-on-write instead of loading their own
+    """
+    warm_up(names)
+    registry.prepare_for_fork()
+
+
+def start_warm_up(names):
+    """warm models up in the background so the server can answer /ready meanwhile"""
+    if not names:
+        return None
+    warmup_status.update({"requested": list(names), "done": False})
+    thread = threading.Thread(target=warm_up, args=(names,), name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def embed_upload(image_path):
+    """upload-time job: decode into image_store, then encode into the embedding cache"""
+    stored = image_store.get(image_path)
+    return segmentor.precompute_array(stored.rgb, segmentor.key_for_digest(stored.digest))
+
+
+def schedule_embedding(digest, image_path):
+    with embedding_jobs_lock:
+        job = embedding_jobs.get(digest)
+        if job is not None:
+            return job
+        job = embedding_pool.submit(embed_upload, image_path)
+        embedding_jobs[digest] = job
+    job.add_done_callback(lambda _: _forget_embedding(digest, job))
+    return job
+
+
+def _forget_embedding(digest, job):
+    with embedding_jobs_lock:
+        if embedding_jobs.get(digest) is job:
+            del embedding_jobs[digest]
+
+
+# write-behind pool for mask files when a client asks for async_write
+mask_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mask-write")
+
+MASK_FORMATS = {'png', 'rle', 'bits', 'npz'}
+
+# masks returned inline by /getpoints, looked up again by /stylize via mask_id
+mask_store = MaskStore(ttl=600)
+
+
+def export_options(data):
+    """mask export settings from a /getpoints style request body"""
+    fmt = data.get('mask_format', 'png')
+    if fmt not in MASK_FORMATS:
+        fmt = 'png'
+    return {
+        "fmt": fmt,
+        "preview": bool(data.get('preview', True)),
+        "writer": mask_writer if data.get('async_write') else None,
+    }
+
+
+def store_inline(state, masks, scores, encoding):
+    """keep masks in mask_store and describe them as compact payloads for the page"""
+    fmt = encoding if encoding in ('rle', 'bits') else 'rle'
+    inline = []
+    for mask, score in zip(state.resize_masks(masks), scores):
+        inline.append({
+            "mask_id": mask_store.put(mask),
+            "mask": encode_mask(mask, fmt),
+            "score": float(score)
+        })
+    return inline
+
+
+def wait_for_embedding(digest):
+    """block on a pending upload-time job so the encoder never runs twice"""
+    with embedding_jobs_lock:
+        job = embedding_jobs.get(digest)
+    if job is not None:
+        try:
+            job.result()
+        except Exception:
+            pass
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 def allowed_file(filename):
@@ -34,10 +180,9 @@ def upload_file():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
+            width, height, digest = image_store.save_upload(file, save_path)
 
-            image = Image.open(save_path)
-            width, height = image.size 
+            schedule_embedding(digest, save_path)
 
             image_url = url_for('static', filename='uploads/' + filename)
 
@@ -46,12 +191,32 @@ def upload_file():
 
 
 
+def scale_point(pt, orig_w, orig_h, tgt_w=1024, tgt_h=1024):
+    x = int(pt[0] * tgt_w / orig_w)
+    y = int(pt[1] * tgt_h / orig_h)
+    return [x, y]
+
+
+def parse_prompt(prompt, orig_w, orig_h):
+    """turn a {foreground, background, box} dict from the page into SAM points/labels/box"""
+    fg = [scale_point([pt["x"], pt["y"]], orig_w, orig_h) for pt in prompt.get('foreground', [])]
+    bg = [scale_point([pt["x"], pt["y"]], orig_w, orig_h) for pt in prompt.get('background', [])]
+    points = fg + bg
+    labels = [1] * len(fg) + [0] * len(bg)
+
+    box_np = None
+    box_dict = prompt.get('box', None)
+    if box_dict and len(box_dict) == 2:
+        x0, y0 = scale_point([box_dict[0]["x"], box_dict[0]["y"]], orig_w, orig_h)
+        x1, y1 = scale_point([box_dict[1]["x"], box_dict[1]["y"]], orig_w, orig_h)
+        box_np = [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)]
+    return points, labels, box_np
+
+
 @app_bp.route('/getpoints', methods=['POST'])
+@profiled
 def getpoints():
     data = request.get_json()
-    fg_dict = data.get('foreground', [])
-    bg_dict = data.get('background', [])
-    box_dict = data.get('box', None)
     filename = data.get('filename', None)
     orig_size = data.get('original_size', None)
 
@@ -63,44 +228,39 @@ def getpoints():
         return jsonify({"message": f"Image file not found: {filename}"}), 404
 
 
-    def scale_point(pt, orig_w, orig_h, tgt_w, tgt_h):
-        x = int(pt[0] * tgt_w / orig_w)
-        y = int(pt[1] * tgt_h / orig_h)
-        return [x, y]
-
-
     orig_w = orig_size.get("width") if orig_size else 1024
     orig_h = orig_size.get("height") if orig_size else 1024
-    tgt_w, tgt_h = 1024, 1024
+    points, labels, box_np = parse_prompt(data, orig_w, orig_h)
 
-
-    fg = [scale_point([pt["x"], pt["y"]], orig_w, orig_h, tgt_w, tgt_h) for pt in fg_dict]
-    bg = [scale_point([pt["x"], pt["y"]], orig_w, orig_h, tgt_w, tgt_h) for pt in bg_dict]
-    points = fg + bg
-    labels = [1] * len(fg) + [0] * len(bg)
-
-
-    box_np = None
-    if box_dict and len(box_dict) == 2:
-        x0, y0 = scale_point([box_dict[0]["x"], box_dict[0]["y"]], orig_w, orig_h, tgt_w, tgt_h)
-        x1, y1 = scale_point([box_dict[1]["x"], box_dict[1]["y"]], orig_w, orig_h, tgt_w, tgt_h)
-        box_np = [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)]
-
-    segmentor.load_image(image_path)
+    try:
+        stored = image_store.get(image_path)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    wait_for_embedding(stored.digest)
+    state = segmentor.state_for_array(stored.rgb, segmentor.key_for_digest(stored.digest))
 
 
     if box_np:
-        masks, scores = segmentor.segment_with_box_and_points(box=box_np, points=points, labels=labels)
+        masks, scores = state.segment_with_box_and_points(box=box_np, points=points, labels=labels)
         mode_used = "box+point" if points else "box-only"
     else:
-        masks, scores = segmentor.segment_all_masks(points, labels)
+        masks, scores = state.segment_all_masks(points, labels)
         mode_used = "point-only"
 
+    if data.get('inline'):
+        inline = store_inline(state, masks, scores, data.get('mask_format'))
+        return jsonify({
+            "message": f"Segmentation completed using [{mode_used}], {len(inline)} results generated.",
+            "masks": inline,
+            "mode": mode_used
+        })
+
     name_without_ext = os.path.splitext(filename)[0]
-    saved_paths = segmentor.export_multiple_masks(
+    saved_paths = state.export_multiple_masks(
         masks,
         base_path="static/uploads",
-        prefix=f"result_{name_without_ext}"
+        prefix=f"result_{name_without_ext}",
+        **export_options(data)
     )
 
     return jsonify({
@@ -111,6 +271,162 @@ def getpoints():
 
 
 
+@app_bp.route('/getpoints_batch', methods=['POST'])
+def getpoints_batch():
+    """segment several independent prompt sets on one image in batched decoder calls"""
+    data = request.get_json()
+    filename = data.get('filename', None)
+    orig_size = data.get('original_size', None)
+    prompt_dicts = data.get('prompts', [])
+    multimask = bool(data.get('multimask', True))
+
+    if not filename or not prompt_dicts:
+        return jsonify({"message": "filename or prompts missing"}), 400
+
+    image_path = os.path.join('static/uploads', filename)
+    if not os.path.exists(image_path):
+        return jsonify({"message": f"Image file not found: {filename}"}), 404
+
+    orig_w = orig_size.get("width") if orig_size else 1024
+    orig_h = orig_size.get("height") if orig_size else 1024
+
+    prompts = []
+    for p in prompt_dicts:
+        points, labels, box_np = parse_prompt(p, orig_w, orig_h)
+        if not points and box_np is None:
+            return jsonify({"message": "every prompt needs at least one point or a box"}), 400
+        prompts.append({"points": points, "labels": labels, "box": box_np})
+
+    try:
+        stored = image_store.get(image_path)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    wait_for_embedding(stored.digest)
+    state = segmentor.state_for_array(stored.rgb, segmentor.key_for_digest(stored.digest))
+    results = state.segment_batch(prompts, multimask=multimask)
+
+    name_without_ext = os.path.splitext(filename)[0]
+    options = export_options(data)
+    objects = []
+    for i, (masks, scores) in enumerate(results):
+        if data.get('inline'):
+            objects.append({"masks": store_inline(state, masks, scores, data.get('mask_format'))})
+            continue
+        saved_paths = state.export_multiple_masks(
+            masks,
+            base_path="static/uploads",
+            prefix=f"result_{name_without_ext}_obj{i}",
+            **options
+        )
+        objects.append({"result": saved_paths, "scores": scores.tolist()})
+
+    return jsonify({
+        "message": f"Segmentation completed for {len(objects)} prompt sets.",
+        "objects": objects
+    })
+
+
+
+@app_bp.route('/mask_preview/<filename>/<int:index>', methods=['GET'])
+def mask_preview(filename, index):
+    """RGBA cut-out for a mask exported with preview=False, rendered on first fetch"""
+    filename = secure_filename(filename)
+    name_without_ext = os.path.splitext(filename)[0]
+    prefix = request.args.get('prefix', f"result_{name_without_ext}")
+    prefix = secure_filename(prefix)
+
+    mask_ref = os.path.join('static/uploads', f"{prefix}_{index}_mask.png")
+    if not os.path.exists(mask_ref):
+        for container in (f"{prefix}_masks.json", f"{prefix}_masks.npz"):
+            container_path = os.path.join('static/uploads', container)
+            if os.path.exists(container_path):
+                mask_ref = f"{container_path}#{index}"
+                break
+
+    preview_path = os.path.join('static/uploads', f"{prefix}_{index}.png")
+    if not os.path.exists(preview_path):
+        try:
+            image = image_store.get(os.path.join('static/uploads', filename)).rgb
+        except (OSError, ValueError):
+            image = None
+        preview_path = render_mask_preview(image, mask_ref, preview_path) if image is not None else None
+    if preview_path is None:
+        return jsonify({"message": "Image or mask not found"}), 404
+    return current_app.send_static_file(os.path.relpath(preview_path, 'static'))
+
+
+
+@app_bp.route('/embedding_status/<filename>', methods=['GET'])
+def embedding_status(filename):
+    filename = secure_filename(filename)
+    image_path = os.path.join('static/uploads', filename)
+    if not os.path.exists(image_path):
+        return jsonify({"status": "missing"}), 404
+    try:
+        digest = image_store.get(image_path).digest
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)})
+
+    with embedding_jobs_lock:
+        job = embedding_jobs.get(digest)
+    if job is not None and not job.done():
+        return jsonify({"status": "pending"})
+    if segmentor.key_for_digest(digest) in segmentor.embedding_cache:
+        return jsonify({"status": "ready"})
+    if job is not None and job.exception() is not None:
+        return jsonify({"status": "error", "message": str(job.exception())})
+    return jsonify({"status": "not_scheduled"})
+
+
+
+@app_bp.route('/ready', methods=['GET'])
+def ready():
+    """200 once the configured warm-up models are loaded, 503 before"""
+    body = dict(warmup_status, loaded=[m["key"] for m in registry.loaded()])
+    if not warmup_status["done"] or warmup_status["errors"]:
+        return jsonify(body), 503
+    return jsonify(body)
+
+
+
+@app_bp.route('/models', methods=['GET'])
+def loaded_models():
+    return jsonify({"models": registry.loaded(), "max_bytes": registry.max_bytes})
+
+
+
+def cache_hit_ratios():
+    ratios = []
+    for cache in ("image", "sam_embedding", "result", "frame"):
+        hits = metrics.value("app_cache_requests_total", cache=cache, result="hit")
+        misses = metrics.value("app_cache_requests_total", cache=cache, result="miss")
+        if hits + misses:
+            ratios.append(({"cache": cache}, hits / (hits + misses)))
+    return ratios
+
+
+metrics.gauge("app_cache_hit_ratio", cache_hit_ratios, "hit ratio per cache since start")
+metrics.gauge("app_image_store_bytes", lambda: image_store.nbytes,
+              "decoded upload bytes held by the image store")
+def model_label(key):
+    return "/".join(map(str, key)) if isinstance(key, list) else str(key)
+
+
+metrics.gauge("app_model_bytes", lambda: [
+    ({"model": model_label(m["key"])}, m["bytes"]) for m in registry.loaded()
+], "parameter and buffer bytes per loaded model")
+metrics.gauge("app_model_load_seconds", lambda: [
+    ({"model": model_label(m["key"])}, m["load_seconds"]) for m in registry.loaded()
+], "how long each loaded model took to load")
+
+
+@app_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """stage timings, cache hit rates and model memory in the Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+
 @app_bp.route('/confirm_result', methods=['POST'])
 def confirm_result():
     data = request.get_json()
@@ -122,69 +438,128 @@ def confirm_result():
         return jsonify({"message": "Missing required data"}), 400
 
     print(f"User confirmed: {fg_result} (foreground), {bg_result} (background) for {filename}")
+    metrics.inc("app_confirmed_results_total")
     return jsonify({"message": f"Confirmed foreground: {os.path.basename(fg_result)}, background: {os.path.basename(bg_result)}"})
 
 
 
 
+def model_version(style):
+    if style in CARTOON_STYLES:
+        family = "cartoon"
+        weights = checkpoint_version(cartoon_checkpoint_path(style))
+    else:
+        family = "animegan"
+        weights = checkpoint_version(animegan_front.model_path)
+    # reduced precision and exported backends change the output, so both
+    # are part of the cache key
+    precision = MODEL_PRECISION.get(family, "fp32")
+    backend = MODEL_BACKEND.get(family, "eager")
+    return f"{STYLIZE_PIPELINE_VERSION}:{weights}:{precision}:{backend}"
+
+
+def stylize_cached(img, mask, style, stylePart, cache_key, **options):
+    """stylize unless the content-addressed cache already has the result"""
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    styled = run_stylize(img, mask, style, stylePart, frame_cache=frame_cache, **options)
+    return result_cache.put(cache_key, styled)
+
+
 @app_bp.route('/stylize', methods=['POST'])
+@profiled
 def stylize():
     data = request.get_json()
     mask_path = data.get("mask_path")
+    mask_id = data.get("mask_id")
     filename  = data.get("filename")
     stylePart = data.get("stylePart", "foreground")  
     style = data.get("style", "Hayao")      
 
-    if not filename or not mask_path:
+    if not filename or not (mask_path or mask_id):
         return jsonify({"message": "Missing filename or mask_path"}), 400
 
     img_path = os.path.join("static/uploads", filename)
-    img = cv2.imread(img_path)
-    mask = cv2.imread(mask_path, 0)
+    stored = None
+    if os.path.exists(img_path):
+        try:
+            stored = image_store.get(img_path)
+        except ValueError:
+            pass
+    img = stored.bgr if stored is not None else None
+    mask = mask_store.get(mask_id) if mask_id else load_mask(mask_path)
 
     if img is None or mask is None:
         return jsonify({"message": "Image or mask not found"}), 404
 
-
-    if style == "Hayao":
-        if stylePart == "foreground":
-            styled = cartoonize_foreground(img, mask,style="Hayao")
-        else:
-            styled = cartoon_effect(img, mask,style="Hayao")
-
-    elif style == "Shinkai":
-        if stylePart == "foreground":
-            styled = cartoonize_foreground(img, mask,style="Shinkai")
-        else:
-            styled = cartoon_effect(img, mask,style="Shinkai")
-        
-    elif style == "Hosoda":
-        if stylePart == "foreground":
-            styled = cartoonize_foreground(img, mask,style="Hosoda")
-        else:
-            styled = cartoon_effect(img, mask,style="Hosoda")
-            
-    elif style == "Paprika":
-        if stylePart == "foreground":
-            styled = cartoonize_foreground(img, mask,style="Paprika")
-        else:
-            styled = cartoon_effect(img, mask,style="Paprika")
-    else:
-        if stylePart == "foreground":
-            styled = animegan_front.stylize_foreground(img, mask)
-        else:
-            styled = animegan_back.stylize_background(img, mask)
-
-    
-    # else:
-    #     if stylePart == "foreground":
-    #         styled = cartoonize_foreground(img, mask)
-    #     else:
-    #         styled = cartoon_effect(img, mask)
-
-    out_name = f"stylized_{style}_{stylePart}_{os.path.splitext(filename)[0]}.jpg"
-    out_path = os.path.join("static/results", out_name)
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    cv2.imwrite(out_path, styled)
-
-    return jsonify({"message": "OK", "styled_path": out_path})
\ No newline at end of file
+    full_frame = bool(data.get("full_frame", False))
+    crop = bool(data.get("crop", False))
+    working_size = data.get("working_size")
+    if working_size is not None:
+        try:
+            working_size = int(working_size)
+        except (TypeError, ValueError):
+            working_size = 0
+        if working_size < MIN_WORKING_SIZE:
+            return jsonify({"message": f"working_size must be an integer >= {MIN_WORKING_SIZE}"}), 400
+        working_size = min(working_size, MAX_WORKING_SIZE)
+    quality = data.get("quality", "full")
+    if quality not in QUALITY_PRESETS:
+        quality = "full"
+    image_hash = stored.digest
+    mask_hash = hashlib.sha256(mask.tobytes()).hexdigest()
+    part_key = stylePart
+    if stylePart == "foreground" and full_frame:
+        part_key += ":full"
+    elif stylePart == "foreground" and crop:
+        part_key += ":crop"
+    if working_size:
+        part_key += f":ws{working_size}"
+    if quality != "full" and style in CARTOON_STYLES and stylePart != "foreground":
+        part_key += f":{quality}"
+    cache_key = ResultCache.key(image_hash, mask_hash, style, part_key, model_version(style))
+    options = {"image_hash": image_hash, "full_frame": full_frame, "crop": crop,
+               "working_size": working_size, "quality": quality}
+
+    cached = result_cache.get(cache_key)
+    cache_lookup("result", cached is not None)
+    if cached is not None:
+        return jsonify({"message": "OK", "styled_path": cached, "cached": True})
+
+    if data.get("async"):
+        job_id, reused = stylize_jobs.submit(cache_key, stylize_cached, img, mask, style, stylePart, cache_key,
+                                             **options)
+        job = stylize_jobs.status(job_id)
+        body = {"job_id": job_id, "status": job["status"], "deduplicated": reused}
+        if job["status"] == "done":
+            body["styled_path"] = job["result"]
+            return jsonify(dict(body, message="OK"))
+        return jsonify(dict(body, message="Queued")), 202
+
+    out_path = stylize_cached(img, mask, style, stylePart, cache_key, **options)
+    return jsonify({"message": "OK", "styled_path": out_path, "cached": False})
+
+
+
+@app_bp.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """summary of a request profile taken with "profile": true / X-Profile"""
+    summary = load_profile(profile_id) if profiling_authorized() else None
+    if summary is None:
+        return jsonify({"message": "Unknown profile"}), 404
+    return jsonify(summary)
+
+
+@app_bp.route('/stylize_status/<job_id>', methods=['GET'])
+def stylize_status(job_id):
+    job = stylize_jobs.status(job_id)
+    if job is None:
+        return jsonify({"message": "Unknown job"}), 404
+
+    body = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        body["styled_path"] = job["result"]
+    elif job["status"] == "error":
+        body["message"] = job["error"]
+    return jsonify(body)
@@ -0,0 +1,183 @@
+# runtime_config.py
+#CPU runtime settings shared by every model path: intra-op threads,
+#inference_mode, channels_last and per-model reduced precision
+#
+#  INFERENCE_THREADS=4                        torch intra-op threads per process
+#  INFERENCE_MODE=0                           use torch.no_grad instead of torch.inference_mode
+#  CHANNELS_LAST=1                            channels_last layout for the conv generators
+#  MODEL_PRECISION=sam=int8,animegan=bf16     fp32 (default), bf16 or int8 per model family
+#                                             (int8 only for sam; see CONV_ONLY_FAMILIES)
+#  MODEL_BACKEND=animegan=onnx,sam=torchscript eager (default), torchscript or onnx per model family
+
+import argparse
+import copy
+import logging
+import os
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+MODEL_FAMILIES = ("sam", "animegan", "cartoon")
+# no nn.Linear layers, so dynamic int8 quantization would leave them unchanged
+CONV_ONLY_FAMILIES = ("animegan", "cartoon")
+
+
+def _parse_family_map(spec):
+    precision = {}
+    for item in spec.split(","):
+        if "=" in item:
+            family, value = item.split("=", 1)
+            precision[family.strip()] = value.strip().lower()
+    return precision
+
+
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "0")) or None
+USE_INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "1") != "0"
+USE_CHANNELS_LAST = os.environ.get("CHANNELS_LAST") == "1"
+MODEL_PRECISION = _parse_family_map(os.environ.get("MODEL_PRECISION", ""))
+for _family in CONV_ONLY_FAMILIES:
+    if MODEL_PRECISION.get(_family) == "int8":
+        # dropped so the result-cache version does not change for identical output
+        logger.warning("MODEL_PRECISION %s=int8 has no effect on a conv-only model; using fp32", _family)
+        del MODEL_PRECISION[_family]
+MODEL_BACKEND = _parse_family_map(os.environ.get("MODEL_BACKEND", ""))
+
+
+def configure_threads(threads=None):
+    """set torch's intra-op thread count; call once per (worker) process"""
+    threads = threads or INFERENCE_THREADS
+    if threads:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+
+def prepare_input(tensor):
+    """match the model's memory format when channels_last is on"""
+    if USE_CHANNELS_LAST and tensor.dim() == 4:
+        return tensor.contiguous(memory_format=torch.channels_last)
+    return tensor
+
+
+def inference_context():
+    """torch.inference_mode() (or no_grad when disabled) for model calls"""
+    if USE_INFERENCE_MODE:
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+class AutocastModule(nn.Module):
+    """runs the wrapped module under CPU bfloat16 autocast and returns float32"""
+    def __init__(self, module, dtype=torch.bfloat16):
+        super().__init__()
+        self.module = module
+        self.dtype = dtype
+
+    def __getattr__(self, name):
+        # callers read attributes of the wrapped module, e.g. SAM's image_encoder.img_size
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.module, name)
+
+    def forward(self, *args, **kwargs):
+        with torch.autocast("cpu", dtype=self.dtype):
+            out = self.module(*args, **kwargs)
+        return out.float() if torch.is_tensor(out) else out
+
+
+def _apply_precision(module, precision):
+    if precision == "bf16":
+        return AutocastModule(module)
+    if precision == "int8":
+        # dynamic int8 only covers nn.Linear (SAM's transformer blocks)
+        return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+    return module
+
+
+def prepare_model(model, family, precision=None):
+    """
+    apply the configured runtime settings to a freshly loaded eval model.
+    For SAM only the image encoder (the expensive part) changes precision,
+    since SamPredictor calls its sub-modules directly.
+    """
+    precision = precision or MODEL_PRECISION.get(family, "fp32")
+    model.eval()
+
+    if family == "sam":
+        model.image_encoder = _apply_precision(model.image_encoder, precision)
+        return model
+
+    if USE_CHANNELS_LAST:
+        model = model.to(memory_format=torch.channels_last)
+    return _apply_precision(model, precision)
+
+
+def compare_to_reference(reference, candidate, inputs):
+    """
+    accuracy of a prepared model against its float32 reference
+    :return: {"max_abs_err", "mean_abs_err", "psnr"} over outputs in [-1, 1]
+    """
+    with inference_context():
+        ref = reference(inputs).float()
+        out = candidate(inputs).float()
+    err = (out - ref).abs()
+    mse = float((err ** 2).mean())
+    peak = 2.0  # tanh outputs span [-1, 1]
+    psnr = float("inf") if mse == 0 else 10.0 * torch.log10(torch.tensor(peak ** 2 / mse)).item()
+    return {"max_abs_err": float(err.max()), "mean_abs_err": float(err.mean()), "psnr": psnr}
+
+
+def check_accuracy(family, model, inputs, precision=None):
+    """prepare a copy of a float32 model and compare it with the original"""
+    candidate = prepare_model(copy.deepcopy(model), family, precision)
+    return compare_to_reference(model.eval(), candidate, inputs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare reduced-precision models with float32")
+    parser.add_argument("family", choices=["animegan", "cartoon", "sam"])
+    parser.add_argument("--precision", default="bf16", choices=["fp32", "bf16", "int8"])
+    parser.add_argument("--size", type=int, default=256)
+    args = parser.parse_args()
+    if args.precision == "int8" and args.family in CONV_ONLY_FAMILIES:
+        parser.error(f"int8 does not change the conv-only {args.family} model; try bf16")
+    configure_threads()
+
+    if args.family == "animegan":
+        from model_registry import build_animegan_model
+        try:
+            model = build_animegan_model()
+        except FileNotFoundError:
+            from animegan2_model import Generator
+            print("AnimeGAN checkpoint not found, using random weights")
+            model = Generator()
+        inputs = torch.rand(1, 3, args.size, args.size) * 2 - 1
+        print(check_accuracy("animegan", model, inputs, args.precision))
+    elif args.family == "cartoon":
+        from model_registry import build_cartoon_model
+        model = build_cartoon_model("Hayao")
+        inputs = torch.rand(1, 3, args.size, args.size) * 2 - 1
+        print(check_accuracy("cartoon", model, inputs, args.precision))
+    else:
+        import numpy as np
+        from segment_anything import SamPredictor
+        from model_registry import build_sam_model
+        try:
+            model = build_sam_model()
+        except OSError:
+            from segment_anything import sam_model_registry
+            print("SAM checkpoint not available, using random weights")
+            model = sam_model_registry["vit_b"](checkpoint=None).eval()
+        candidate = prepare_model(copy.deepcopy(model), "sam", args.precision)
+
+        # through SamPredictor, the way the routes use the prepared model
+        def embed(sam):
+            def run(image):
+                predictor = SamPredictor(sam)
+                predictor.set_image(image)
+                return predictor.features
+            return run
+        image = np.random.default_rng(0).integers(0, 256, (args.size, args.size * 4 // 3, 3), dtype=np.uint8)
+        print(compare_to_reference(embed(model), embed(candidate), image))
@@ -0,0 +1,178 @@
+# sam_auto.py
+#"segment everything" mode on top of SAMSegmentor
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+import torch
+
+
+def box_iou(box, boxes):
+    """IoU of one [x0, y0, x1, y1] box against an (N, 4) array"""
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[2], boxes[:, 2])
+    y1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+
+def nms(boxes, scores, iou_thresh):
+    """greedy non-maximum suppression, returns kept indices by descending score"""
+    order = np.argsort(-scores)
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        ious = box_iou(boxes[i], boxes[order[1:]])
+        order = order[1:][ious <= iou_thresh]
+    return keep
+
+
+def tile_origins(length, tile, overlap):
+    """start offsets covering [0, length) with tiles of size tile; the last one is flush with the end"""
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def record_boxes(records):
+    """(N, 4) [x0, y0, x1, y1] array from records' [x, y, w, h] bboxes"""
+    return np.array([[r["bbox"][0], r["bbox"][1],
+                      r["bbox"][0] + r["bbox"][2], r["bbox"][1] + r["bbox"][3]]
+                     for r in records], dtype=np.float32)
+
+
+def paste_mask(record, shape):
+    """expand a record's bbox-cropped mask into a full (h, w) bool array"""
+    full = np.zeros(shape[:2], dtype=bool)
+    x, y, w, h = record["bbox"]
+    full[y:y + h, x:x + w] = record["segmentation"]
+    return full
+
+
+class AutoMaskGenerator:
+    """
+    Prompt SAM with a regular point grid and collect every object it finds.
+    Large images are split into overlapping tiles; each tile is encoded
+    once (through the segmentor's embedding cache) and all grid points are
+    decoded against that single embedding in batches.
+    """
+    def __init__(self, segmentor, points_per_side=16, points_per_batch=32,
+                 pred_iou_thresh=0.86, nms_thresh=0.7, min_area=100,
+                 tile_size=None, tile_overlap=128):
+        self.segmentor = segmentor
+        self.points_per_side = points_per_side
+        self.points_per_batch = points_per_batch
+        self.pred_iou_thresh = pred_iou_thresh
+        self.nms_thresh = nms_thresh
+        self.min_area = min_area
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+
+    def generate(self, image_path):
+        """
+        :return: list of {"segmentation": bool mask cropped to bbox,
+                          "bbox": [x, y, w, h] in image pixels, "area", "score"}
+        """
+        with open(image_path, "rb") as f:
+            data = f.read()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"cannot decode image: {image_path}")
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        base_key = self.segmentor.image_key(data)
+
+        h, w = image.shape[:2]
+        tile = self.tile_size or max(h, w)
+        records = []
+        for y0 in tile_origins(h, tile, self.tile_overlap):
+            for x0 in tile_origins(w, tile, self.tile_overlap):
+                crop = image[y0:y0 + tile, x0:x0 + tile]
+                key = base_key if crop.shape[:2] == (h, w) else \
+                    f"{base_key}_tile{x0}_{y0}_{crop.shape[1]}x{crop.shape[0]}"
+                state = self.segmentor.state_for_array(crop, key)
+                records += self._generate_tile(state, x0, y0)
+
+        if not records:
+            return []
+        scores = np.array([r["score"] for r in records], dtype=np.float32)
+        return [records[i] for i in nms(record_boxes(records), scores, self.nms_thresh)]
+
+    def _generate_tile(self, state, x0, y0):
+        th, tw = state.original_image.shape[:2]
+        n = self.points_per_side
+        xs = (np.arange(n) + 0.5) / n * tw
+        ys = (np.arange(n) + 0.5) / n * th
+        grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 1, 2)
+
+        transform = state.predictor.transform
+        orig_hw = state.predictor.original_size
+        records = []
+        for start in range(0, len(grid), self.points_per_batch):
+            coords = transform.apply_coords(grid[start:start + self.points_per_batch], orig_hw)
+            coords_t = torch.as_tensor(coords, dtype=torch.float, device=state.device)
+            labels_t = torch.ones(coords_t.shape[:2], dtype=torch.int, device=state.device)
+            masks, scores, _ = state.predictor.predict_torch(
+                point_coords=coords_t,
+                point_labels=labels_t,
+                multimask_output=True
+            )
+            masks = masks.flatten(0, 1)
+            scores = scores.flatten().float()
+            keep = scores > self.pred_iou_thresh
+            masks = masks[keep].cpu().numpy()
+            scores = scores[keep].cpu().numpy()
+
+            # per-batch NMS so at most a few masks per point survive
+            batch = []
+            for mask, score in zip(masks, scores):
+                ys_, xs_ = np.nonzero(mask)
+                if len(xs_) < self.min_area:
+                    continue
+                bx0, by0, bx1, by1 = xs_.min(), ys_.min(), xs_.max() + 1, ys_.max() + 1
+                batch.append({
+                    "segmentation": mask[by0:by1, bx0:bx1].copy(),
+                    "bbox": [int(bx0 + x0), int(by0 + y0), int(bx1 - bx0), int(by1 - by0)],
+                    "area": int(len(xs_)),
+                    "score": float(score),
+                })
+            if batch:
+                kept = nms(record_boxes(batch), np.array([r["score"] for r in batch]), self.nms_thresh)
+                records += [batch[i] for i in kept]
+        return records
+
+
+if __name__ == "__main__":
+    from sam_func import SAMSegmentor
+
+    parser = argparse.ArgumentParser(description="segment everything in an image with SAM")
+    parser.add_argument("image")
+    parser.add_argument("--out", default="output/auto_masks")
+    parser.add_argument("--points-per-side", type=int, default=16)
+    parser.add_argument("--tile-size", type=int, default=None)
+    parser.add_argument("--tile-overlap", type=int, default=128)
+    args = parser.parse_args()
+
+    segmentor = SAMSegmentor(cache_dir=os.path.join("checkpoints", "sam_cache"))
+    generator = AutoMaskGenerator(
+        segmentor,
+        points_per_side=args.points_per_side,
+        tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap,
+    )
+    image_shape = cv2.imread(args.image).shape
+    os.makedirs(args.out, exist_ok=True)
+    records = generator.generate(args.image)
+    for i, r in enumerate(records):
+        cv2.imwrite(os.path.join(args.out, f"mask_{i}.png"), paste_mask(r, image_shape).astype(np.uint8) * 255)
+    print(f"{len(records)} masks written to {args.out}")
@@ -4,45 +4,178 @@
 import torch
 import numpy as np
 import cv2
-from segment_anything import sam_model_registry, SamPredictor
+from segment_anything import SamPredictor
 from PIL import Image
 import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 
 from torch.hub import load_state_dict_from_url
 
-
-class SAMSegmentor:
-    def __init__(self, model_type="vit_b", device=None):
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        #model_type = "vit_b"
-
-
-        checkpoint_dir = os.path.join(os.getcwd(), "checkpoints")
-        os.makedirs(checkpoint_dir, exist_ok=True)
-        checkpoint_path = os.path.join(checkpoint_dir, "sam_vit_b_01ec64.pth")
-
-
-        if not os.path.exists(checkpoint_path):
-            url = "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth"
-            print(f"Downloading model to {checkpoint_path} ...")
-            torch.hub.download_url_to_file(url, checkpoint_path)
-            print("Download complete.")
-
-        self.model = sam_model_registry[model_type](checkpoint=None)
-        state_dict = torch.load(checkpoint_path, map_location=self.device)
-        self.model.load_state_dict(state_dict)
-        self.model.to(self.device)
-        self.predictor = SamPredictor(self.model)
-    
-
-    def load_image(self, image_path):
-        image = cv2.imread(image_path)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        self.original_image = image.copy()
+from mask_codec import encode_mask, load_mask
+from model_registry import load_sam_model
+from runtime_config import inference_context, MODEL_PRECISION
+from metrics import timed, cache_lookup
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU of SAM image embeddings keyed by image content hash.
+    With cache_dir set, entries are also written as .npy/.json pairs and
+    read back memory-mapped, so they survive process restarts. When those
+    files grow past max_disk_bytes the least recently used are deleted.
+    """
+    def __init__(self, max_items=8, cache_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_total = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        return (os.path.join(self.cache_dir, f"{key}.npy"),
+                os.path.join(self.cache_dir, f"{key}.json"))
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        if not self.cache_dir:
+            return None
+        feat_path, meta_path = self._paths(key)
+        if not (os.path.exists(feat_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            features = np.load(feat_path, mmap_mode="r")
+            # mark as recently used for disk eviction
+            os.utime(feat_path)
+        except (OSError, ValueError):
+            return None
+
+        entry = {
+            "features": features,
+            "original_size": tuple(meta["original_size"]),
+            "input_size": tuple(meta["input_size"]),
+        }
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if not self.cache_dir:
+            return
+        feat_path, meta_path = self._paths(key)
+        # write to temp files first so a crash never leaves a half entry
+        tmp_feat = f"{feat_path}.{threading.get_ident()}.tmp"
+        with open(tmp_feat, "wb") as f:
+            np.save(f, entry["features"])
+        os.replace(tmp_feat, feat_path)
+        tmp_meta = f"{meta_path}.{threading.get_ident()}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump({
+                "original_size": list(entry["original_size"]),
+                "input_size": list(entry["input_size"]),
+            }, f)
+        os.replace(tmp_meta, meta_path)
+        self._account(feat_path, meta_path)
+
+    def _account(self, feat_path, meta_path):
+        size = os.path.getsize(feat_path) + os.path.getsize(meta_path)
+        with self._disk_lock:
+            if self._disk_total is None:
+                self._disk_total = self._scan_total()
+            else:
+                self._disk_total += size
+            if self._disk_total > self.max_disk_bytes:
+                self._evict(keep=feat_path)
+
+    def _disk_entries(self):
+        """(feature file, metadata file) pairs on disk, least recently used first"""
+        entries = []
+        for e in os.scandir(self.cache_dir):
+            if e.is_file() and e.name.endswith(".npy"):
+                meta_path = e.path[:-len(".npy")] + ".json"
+                try:
+                    entries.append((e.stat().st_mtime, e.path, meta_path))
+                except OSError:
+                    pass
+        entries.sort()
+        return [(feat, meta) for _, feat, meta in entries]
+
+    def _scan_total(self):
+        total = 0
+        for paths in self._disk_entries():
+            for path in paths:
+                try:
+                    total += os.path.getsize(path)
+                except OSError:
+                    pass
+        return total
+
+    def _evict(self, keep):
+        for feat_path, meta_path in self._disk_entries():
+            if self._disk_total <= self.max_disk_bytes:
+                break
+            if feat_path == keep:
+                continue
+            for path in (feat_path, meta_path):
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    self._disk_total -= size
+                except OSError:
+                    pass
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._items:
+                return True
+        if not self.cache_dir:
+            return False
+        return all(os.path.exists(p) for p in self._paths(key))
+
+
+class SAMImageState:
+    """
+    Prompt state for one image: its own SamPredictor over the shared SAM
+    weights, holding that image's embedding and the decoded RGB image.
+    Separate states can be prompted from different threads concurrently.
+    """
+    def __init__(self, model, image, entry, device):
+        self.device = device
+        self.original_image = image
         self.original_size = (image.shape[1], image.shape[0])
 
-        self.predictor.set_image(image)
-        return image
+        self.predictor = SamPredictor(model)
+        features = entry["features"]
+        if isinstance(features, np.ndarray):
+            if not features.flags.writeable:
+                features = np.array(features)
+            features = torch.from_numpy(features)
+        self.predictor.original_size = tuple(entry["original_size"])
+        self.predictor.input_size = tuple(entry["input_size"])
+        self.predictor.features = features.to(device)
+        self.predictor.is_image_set = True
 
     def segment_with_points(self, points, labels, multimask=True):
         """
@@ -54,11 +187,12 @@ class SAMSegmentor:
         input_points = np.array(points)
         input_labels = np.array(labels)
 
-        masks, scores, logits = self.predictor.predict(
-            point_coords=input_points,
-            point_labels=input_labels,
-            multimask_output=multimask
-        )
+        with timed("sam_decode", model="SAM.mask_decoder"):
+            masks, scores, logits = self.predictor.predict(
+                point_coords=input_points,
+                point_labels=input_labels,
+                multimask_output=multimask
+            )
         best_idx = scores.argmax()
         return masks[best_idx], scores
 
@@ -76,7 +210,8 @@ class SAMSegmentor:
             kwargs["point_coords"] = np.array(points)
             kwargs["point_labels"] = np.array(labels)
 
-        masks, scores, logits = self.predictor.predict(**kwargs)
+        with timed("sam_decode", model="SAM.mask_decoder"):
+            masks, scores, logits = self.predictor.predict(**kwargs)
         return masks, scores
 
 
@@ -113,42 +248,326 @@ class SAMSegmentor:
         input_points = np.array(points)
         input_labels = np.array(labels)
 
-        masks, scores, logits = self.predictor.predict(
-            point_coords=input_points,
-            point_labels=input_labels,
-            multimask_output=multimask
-        )
+        with timed("sam_decode", model="SAM.mask_decoder"):
+            masks, scores, logits = self.predictor.predict(
+                point_coords=input_points,
+                point_labels=input_labels,
+                multimask_output=multimask
+            )
         return masks, scores
 
 
 
-    def export_multiple_masks(self, masks, base_path="output", prefix="result"):
-        if not hasattr(self, 'original_image'):
-            raise RuntimeError("please first call load_image()")
-
-        os.makedirs(base_path, exist_ok=True)
-        saved_paths = []
-
-        for i, mask in enumerate(masks):
-            h, w = self.original_image.shape[:2]
-            resized_mask = cv2.resize(
-                mask.astype(np.uint8),
+    def segment_batch(self, prompts, multimask=True, max_batch=16):
+        """
+        decode many independent prompt sets for this image at once
+        :param prompts: [{"points": [[x, y], ...], "labels": [1, 0, ...], "box": [x0, y0, x1, y1]}, ...]
+                        points/labels or box may be omitted
+        :param max_batch: upper bound on prompts per predict_torch call
+        :return: [(masks, scores), ...] in the order of prompts
+        """
+        # prompts with the same point count and box presence stack into one
+        # tensor without padding, so each result matches a single predict()
+        groups = {}
+        for i, p in enumerate(prompts):
+            n_points = len(p.get("points") or [])
+            has_box = p.get("box") is not None
+            groups.setdefault((n_points, has_box), []).append(i)
+
+        transform = self.predictor.transform
+        orig_hw = self.predictor.original_size
+        results = [None] * len(prompts)
+
+        for (n_points, has_box), indices in groups.items():
+            for start in range(0, len(indices), max_batch):
+                chunk = indices[start:start + max_batch]
+
+                coords_t = labels_t = boxes_t = None
+                if n_points:
+                    coords = np.array([prompts[i]["points"] for i in chunk], dtype=np.float32)
+                    labels = np.array([prompts[i]["labels"] for i in chunk], dtype=np.int64)
+                    coords = transform.apply_coords(coords, orig_hw)
+                    coords_t = torch.as_tensor(coords, dtype=torch.float, device=self.device)
+                    labels_t = torch.as_tensor(labels, dtype=torch.int, device=self.device)
+                if has_box:
+                    boxes = np.array([prompts[i]["box"] for i in chunk], dtype=np.float32)
+                    boxes = transform.apply_boxes(boxes, orig_hw)
+                    boxes_t = torch.as_tensor(boxes, dtype=torch.float, device=self.device)
+
+                with timed("sam_decode", model="SAM.mask_decoder"):
+                    masks, scores, _ = self.predictor.predict_torch(
+                        point_coords=coords_t,
+                        point_labels=labels_t,
+                        boxes=boxes_t,
+                        multimask_output=multimask
+                    )
+                masks = masks.cpu().numpy()
+                scores = scores.float().cpu().numpy()
+                for j, i in enumerate(chunk):
+                    results[i] = (masks[j], scores[j])
+
+        return results
+
+
+
+    def resize_masks(self, masks):
+        """all masks to original image size as one (n, h, w) uint8 0/1 stack"""
+        h, w = self.original_image.shape[:2]
+        masks = np.asarray(masks).astype(np.uint8)
+        if masks.shape[1:] == (h, w):
+            return masks
+
+        # cv2.resize handles up to 512 channels per call
+        stacked = masks.transpose(1, 2, 0)
+        resized = []
+        for start in range(0, stacked.shape[2], 512):
+            chunk = cv2.resize(
+                np.ascontiguousarray(stacked[:, :, start:start + 512]),
                 (w, h),
                 interpolation=cv2.INTER_NEAREST
             )
-            alpha = (resized_mask * 255).astype(np.uint8)
+            resized.append(chunk.reshape(h, w, -1))
+        return np.concatenate(resized, axis=2).transpose(2, 0, 1)
 
 
+    @timed("mask_export")
+    def export_multiple_masks(self, masks, base_path="output", prefix="result",
+                              fmt="png", preview=True, writer=None):
+        """
+        :param fmt: "png" -> {prefix}_{i}_mask.png per mask (+ {prefix}_{i}.png RGBA preview)
+                    "rle" / "bits" -> one {prefix}_masks.json of encoded masks
+                    "npz" -> one compressed {prefix}_masks.npz of packed bits
+        :param preview: write RGBA previews in png mode; otherwise they are
+                        rendered on first fetch by render_mask_preview
+        :param writer: executor used for file writes (None = write inline)
+        :return: saved paths; multi-mask files are referenced as "path#i"
+        """
+        os.makedirs(base_path, exist_ok=True)
+        alphas = self.resize_masks(masks) * np.uint8(255)
+        submit = (lambda fn, *args: _submit_logged(writer, fn, *args)) if writer is not None \
+            else (lambda fn, *args: fn(*args))
+
+        if fmt in ("rle", "bits"):
+            path = os.path.join(base_path, f"{prefix}_masks.json")
+            payload = {"masks": [encode_mask(a, fmt) for a in alphas]}
+            submit(_write_json, path, payload)
+            return [f"{path}#{i}" for i in range(len(alphas))]
+
+        if fmt == "npz":
+            path = os.path.join(base_path, f"{prefix}_masks.npz")
+            h, w = alphas.shape[1:]
+            bits = np.packbits(alphas.reshape(len(alphas), -1).astype(bool), axis=1)
+            submit(_write_npz, path, bits, np.array([h, w]))
+            return [f"{path}#{i}" for i in range(len(alphas))]
+
+        if fmt != "png":
+            raise ValueError(f"unknown mask format: {fmt}")
+
+        saved_paths = []
+        for i, alpha in enumerate(alphas):
             mask_path = os.path.join(base_path, f"{prefix}_{i}_mask.png")
-            cv2.imwrite(mask_path, alpha)
+            submit(_write_png, mask_path, alpha)
             saved_paths.append(mask_path)
 
-            rgba = np.dstack((self.original_image, alpha))
-            rgba_path = os.path.join(base_path, f"{prefix}_{i}.png")
-            os.makedirs(os.path.dirname(rgba_path), exist_ok=True)
-            Image.fromarray(rgba).save(rgba_path)
-            saved_paths.append(rgba_path)
+            if preview:
+                rgba_path = os.path.join(base_path, f"{prefix}_{i}.png")
+                submit(_write_rgba, rgba_path, self.original_image, alpha)
+                saved_paths.append(rgba_path)
 
         return saved_paths
 
+
+def _log_write_error(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("write-behind mask export failed: %s", error, exc_info=error)
+
+
+def _submit_logged(writer, fn, *args):
+    # the response has already returned these paths, so a failure can only be logged
+    future = writer.submit(fn, *args)
+    future.add_done_callback(_log_write_error)
+    return future
+
+
+def _temp_path(path):
+    # same extension, so cv2/PIL pick the right encoder
+    root, ext = os.path.splitext(path)
+    return f"{root}.{threading.get_ident()}.tmp{ext}"
+
+
+# mask files are written to a temp name and renamed, so a reader racing a
+# write-behind export never sees a half-written file
+
+def _write_png(path, image):
+    tmp = _temp_path(path)
+    if not cv2.imwrite(tmp, image):
+        raise IOError(f"cannot write {path}")
+    os.replace(tmp, path)
+
+
+def _write_json(path, payload):
+    tmp = _temp_path(path)
+    with open(tmp, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+def _write_npz(path, bits, size):
+    tmp = _temp_path(path)
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, bits=bits, size=size)
+    os.replace(tmp, path)
+
+
+def _write_rgba(path, image_rgb, alpha):
+    tmp = _temp_path(path)
+    Image.fromarray(np.dstack((image_rgb, alpha))).save(tmp, format="PNG")
+    os.replace(tmp, path)
+
+
+def render_mask_preview(image, mask_ref, save_path):
+    """
+    build the RGBA preview for a mask lazily; returns save_path or None
+    :param image: image path, or the already decoded RGB array
+    """
+    if os.path.exists(save_path):
+        return save_path
+    if isinstance(image, str):
+        image = cv2.imread(image)
+        if image is not None:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    alpha = load_mask(mask_ref)
+    if image is None or alpha is None:
+        return None
+    if alpha.shape != image.shape[:2]:
+        alpha = cv2.resize(alpha, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
+    _write_rgba(save_path, image, alpha)
+    return save_path
+
+
+class SAMSegmentor:
+    def __init__(self, model_type="vit_b", device=None, cache_size=8, cache_dir=None,
+                 cache_disk_bytes=1024 * 1024 * 1024):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model_type = model_type
+        #model_type = "vit_b"
+
+
+        self.embedding_cache = EmbeddingCache(max_items=cache_size, cache_dir=cache_dir,
+                                              max_disk_bytes=cache_disk_bytes)
+        self._state = None
+
+    @property
+    def model(self):
+        # loaded (and downloaded if needed) on first use, then shared via the registry
+        return load_sam_model(self.model_type, self.device)
     
+
+    def image_key(self, image_bytes):
+        """cache key of an encoded image file: content hash + model type + encoder precision"""
+        return self.key_for_digest(hashlib.sha256(image_bytes).hexdigest())
+
+    def key_for_digest(self, digest):
+        """image_key() from an already computed sha256 hex digest of the file"""
+        precision = MODEL_PRECISION.get("sam", "fp32")
+        if precision == "fp32":
+            return f"{self.model_type}_{digest}"
+        return f"{self.model_type}_{precision}_{digest}"
+
+    @timed("sam_encode", model="SAM.image_encoder")
+    def compute_embedding(self, image):
+        """
+        run the image encoder on an RGB image and return a cache entry
+        (features on CPU, original_size, input_size)
+        """
+        predictor = SamPredictor(self.model)
+        with inference_context():
+            predictor.set_image(image)
+        return {
+            "features": predictor.features.detach().cpu().numpy(),
+            "original_size": tuple(predictor.original_size),
+            "input_size": tuple(predictor.input_size),
+        }
+
+    def precompute(self, image_path):
+        """
+        encode an image into the embedding cache ahead of the first prompt.
+        returns the cache key.
+        """
+        with open(image_path, "rb") as f:
+            data = f.read()
+        key = self.image_key(data)
+        if key in self.embedding_cache:
+            return key
+
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"cannot decode image: {image_path}")
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return self.precompute_array(image, key)
+
+    def precompute_array(self, image, key):
+        """precompute() for an already decoded RGB array cached under key"""
+        if key not in self.embedding_cache:
+            self.embedding_cache.put(key, self.compute_embedding(image))
+        return key
+
+    def create_state(self, image_path):
+        """
+        decode an image and return a SAMImageState for it, reusing the
+        cached embedding when there is one. Safe to call from many threads.
+        """
+        with open(image_path, "rb") as f:
+            data = f.read()
+        with timed("image_decode"):
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if image is not None:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if image is None:
+            raise ValueError(f"cannot decode image: {image_path}")
+        return self.state_for_array(image, self.image_key(data))
+
+    def state_for_array(self, image, key):
+        """SAMImageState for an already decoded RGB array, cached under key"""
+        entry = self.embedding_cache.get(key)
+        cache_lookup("sam_embedding", entry is not None)
+        if entry is None:
+            entry = self.compute_embedding(image)
+            self.embedding_cache.put(key, entry)
+        return SAMImageState(self.model, image, entry, self.device)
+
+    # single-user helpers kept for scripts; the web routes use create_state()
+    def load_image(self, image_path):
+        self._state = self.create_state(image_path)
+        self.predictor = self._state.predictor
+        self.original_image = self._state.original_image
+        self.original_size = self._state.original_size
+        return self._state.original_image
+
+    def _current(self):
+        if self._state is None:
+            raise RuntimeError("please first call load_image()")
+        return self._state
+
+    def segment_with_points(self, points, labels, multimask=True):
+        return self._current().segment_with_points(points, labels, multimask)
+
+    def segment_with_box_and_points(self, box, points=None, labels=None, multimask=True):
+        return self._current().segment_with_box_and_points(box, points, labels, multimask)
+
+    def segment_all_masks(self, points, labels, multimask=True):
+        return self._current().segment_all_masks(points, labels, multimask)
+
+    def export_foreground_with_alpha(self, mask, save_path="output/foreground.png"):
+        return self._current().export_foreground_with_alpha(mask, save_path)
+
+    def export_foreground_black_bg(self, mask, save_path="output/foreground_black.jpg"):
+        return self._current().export_foreground_black_bg(mask, save_path)
+
+    def segment_batch(self, prompts, multimask=True, max_batch=16):
+        return self._current().segment_batch(prompts, multimask, max_batch)
+
+    def export_multiple_masks(self, masks, base_path="output", prefix="result",
+                              fmt="png", preview=True, writer=None):
+        return self._current().export_multiple_masks(masks, base_path, prefix, fmt, preview, writer)
@@ -50,6 +50,21 @@ document.addEventListener("DOMContentLoaded", function () {
         const parts = img.src.split('/');
         currentFilename = parts[parts.length - 1];
         setMode('foreground');
+        pollEmbeddingStatus();
+    }
+
+
+    function pollEmbeddingStatus() {
+        fetch(`/embedding_status/${encodeURIComponent(currentFilename)}`)
+            .then(res => res.json())
+            .then(data => {
+                if (data.status === "pending") {
+                    setTimeout(pollEmbeddingStatus, 1000);
+                } else {
+                    console.log("image embedding:", data.status);
+                }
+            })
+            .catch(err => console.error("embedding status failed", err));
     }
 
 
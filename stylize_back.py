@@ -1,32 +1,11 @@
 import cv2
 import numpy as np
 import torch
-from PIL import Image
-import sys
-import os
 
-# 添加 CartoonGAN 路径
-sys.path.append(os.path.abspath(
-    os.path.join(os.path.dirname(__file__), 'CartoonGAN_Test')
-))
-from CartoonGAN_Test.network.Transformer import Transformer
-
-_model_cache = {}  # 替代 _cartoon_model，全局缓存多个模型
-
-def load_cartoon_model(style="Hayao"):
-    if style in _model_cache:
-        return _model_cache[style]
-
-    model_path = os.path.join(
-        os.path.dirname(__file__),
-        f"CartoonGAN_Test/pretrained_model/{style}_net_G_float.pth"
-    )
-    model = Transformer()
-    state = torch.load(model_path, map_location="cpu")
-    model.load_state_dict(state)
-    model.eval()
-    _model_cache[style] = model
-    return model
+from model_registry import load_cartoon_model, load_cartoon_gray_model
+from batch_scheduler import run_batched
+from tiled_inference import tiled_forward, working_shape
+from metrics import timed
 
 
 
@@ -39,23 +18,36 @@ def apply_histogram_smoothing(img_bgr):
 def enhance_structure(img_bgr):
     return cv2.edgePreservingFilter(img_bgr, flags=1, sigma_s=60, sigma_r=0.4)
 
-def cartoon_effect(img_bgr, mask=None, style="Hayao"):
-    enhanced = enhance_structure(img_bgr)
+def cartoon_full_frame(img_bgr, style="Hayao", working_size=None):
+    """
+    the mask-independent part of cartoon_effect: the whole stylized frame.
+    working_size bounds the network resolution (long side) and runs it in
+    overlapping tiles; by default the network sees the full-size image.
+    """
+    with timed("preprocess"):
+        enhanced = enhance_structure(img_bgr)
 
-    rgb = cv2.cvtColor(enhanced, cv2.COLOR_BGR2RGB)
-    lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)
-    L, a, b = cv2.split(lab)
+        rgb = cv2.cvtColor(enhanced, cv2.COLOR_BGR2RGB)
+        lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)
+        L, a, b = cv2.split(lab)
 
-    L_norm = (L.astype(np.float32) / 255.0) * 2.0 - 1.0
+        L_in = L
+        if working_size:
+            wh, ww = working_shape(L.shape[0], L.shape[1], working_size)
+            L_in = cv2.resize(L, (ww, wh), interpolation=cv2.INTER_AREA)
 
-    tensor_L = torch.from_numpy(L_norm).unsqueeze(0).unsqueeze(0) 
-    input_tensor = tensor_L.repeat(1, 3, 1, 1)                     
+        L_norm = (L_in.astype(np.float32) / 255.0) * 2.0 - 1.0
+
+        tensor_L = torch.from_numpy(L_norm).unsqueeze(0).unsqueeze(0)
+        input_tensor = tensor_L.repeat(1, 3, 1, 1)
 
     model = load_cartoon_model(style)
-    with torch.no_grad():
-        out = model(input_tensor)       
-        out = out.squeeze(0).cpu()      
-        out = (out + 1.0) / 2.0         
+    if working_size:
+        out = tiled_forward(lambda t: run_batched(("cartoon", style), model, t), input_tensor)
+    else:
+        out = run_batched(("cartoon", style), model, input_tensor)
+    out = out.squeeze(0).cpu()      
+    out = (out + 1.0) / 2.0         
 
     stylized_L = out.mean(dim=0).numpy()        
     stylized_L = (stylized_L * 255.0).clip(0,255).astype(np.uint8)
@@ -93,24 +85,87 @@ def cartoon_effect(img_bgr, mask=None, style="Hayao"):
     stylized_bgr = cv2.cvtColor(rgb_stylized, cv2.COLOR_RGB2BGR)
 
 
-    stylized_bgr = apply_histogram_smoothing(stylized_bgr)
+    return apply_histogram_smoothing(stylized_bgr)
+
+
+# quality presets for cartoon_effect: long side the structure filter and the
+# network run at in the fast pipeline (None = original full-size pipeline)
+QUALITY_PRESETS = {"full": None, "balanced": 1024, "fast": 512}
+
+
+def cartoon_full_frame_fast(img_bgr, style="Hayao", max_side=512):
+    """
+    cheaper cartoon_full_frame with the same steps: structure filter, L-channel
+    CartoonGAN pass, dark-region CLAHE blend, histogram smoothing.
+    Larger images are shrunk to max_side (long side) for the edge-preserving
+    filter and the network; chroma and the stylized L are upsampled back,
+    which is visually close since both are smooth after filtering. Images
+    that already fit are not resized, and then the result matches
+    cartoon_full_frame to within float rounding (a level here and there).
+    """
+    h, w = img_bgr.shape[:2]
+    if max(h, w) > max_side:
+        wh, ww = working_shape(h, w, max_side)
+        small = cv2.resize(img_bgr, (ww, wh), interpolation=cv2.INTER_AREA)
+    else:
+        wh, ww = h, w
+        small = img_bgr
+    with timed("preprocess"):
+        enhanced = enhance_structure(small)
+
+        # BGR -> LAB directly, no RGB round trip
+        lab_small = cv2.cvtColor(enhanced, cv2.COLOR_BGR2LAB)
+        L_small = lab_small[..., 0]
+        L_norm = torch.from_numpy(L_small).float().div_(127.5).sub_(1.0)
+
+    # the gray model's first conv is folded to take L as one channel; the
+    # exported backends still need L repeated three times
+    model = load_cartoon_gray_model(style)
+    if model is not None:
+        out = run_batched(("cartoon_gray", style), model, L_norm.view(1, 1, wh, ww))
+    else:
+        out = run_batched(("cartoon", style), load_cartoon_model(style),
+                          L_norm.expand(1, 3, wh, ww).contiguous())
+    stylized_small = ((out[0].float().mean(dim=0) + 1.0) * 127.5).clamp_(0, 255).to(torch.uint8).numpy()
+
+    lab = cv2.resize(lab_small, (w, h), interpolation=cv2.INTER_LINEAR)
+    L = lab[..., 0]
+    stylized_L = cv2.resize(stylized_small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    # dark areas: 0.3 * CLAHE(L) + 0.7 * stylized, one vectorized select;
+    # truncated like cartoon_full_frame, not rounded
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    blended = (0.3 * clahe.apply(L) + 0.7 * stylized_L).astype(np.uint8)
+    lab[..., 0] = np.where(L < 50, blended, stylized_L)
 
+    stylized_bgr = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+    return apply_histogram_smoothing(stylized_bgr)
 
-    if mask is not None:
 
-        if len(mask.shape) == 3:
-            mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
+def cartoon_effect(img_bgr, mask=None, style="Hayao", stylized_bgr=None, working_size=None,
+                   quality="full"):
+    """
+    stylize the background (everything outside mask), or the whole frame
+    without a mask; pass a cached cartoon_full_frame result as stylized_bgr
+    to skip inference.
+    quality: "full" (original pipeline), "balanced" or "fast" (see QUALITY_PRESETS)
+    """
+    if stylized_bgr is None:
+        max_side = QUALITY_PRESETS.get(quality)
+        if max_side:
+            stylized_bgr = cartoon_full_frame_fast(img_bgr, style, max_side=max_side)
+        else:
+            stylized_bgr = cartoon_full_frame(img_bgr, style, working_size=working_size)
 
 
-        mask = cv2.bitwise_not(mask)
+    if mask is not None:
 
-        _, mask_bin = cv2.threshold(mask, 128, 255, cv2.THRESH_BINARY)
+        if len(mask.shape) == 3:
+            mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
 
-        result = img_bgr.copy()
-        result[mask_bin == 255] = stylized_bgr[mask_bin == 255]
-        return result
+        # background = mask < 128, composited in one step
+        with timed("composite"):
+            return np.where((mask < 128)[..., None], stylized_bgr, img_bgr)
 
 
     return stylized_bgr
-
-
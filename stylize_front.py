@@ -1,63 +1,91 @@
 import cv2
 import numpy as np
 import torch
-from PIL import Image
-import sys
-import os
 
+from model_registry import load_cartoon_model
+from batch_scheduler import run_batched
+from crop_utils import mask_bbox, working_size as crop_working_size
+from tiled_inference import stylize_rgb_tiled
+from metrics import timed
 
-sys.path.append(os.path.abspath(
-    os.path.join(os.path.dirname(__file__), 'CartoonGAN_Test')
-))
-from CartoonGAN_Test.network.Transformer import Transformer
 
-_model_cache = {}  
 
-def load_cartoon_model(style="Hayao"):
-    if style in _model_cache:
-        return _model_cache[style]
+def cartoonize_full(img_bgr, style="Hayao", working_size=None):
+    """whole-frame CartoonGAN pass, independent of any mask"""
+    rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    h, w = rgb.shape[:2]
+    return cv2.cvtColor(_cartoonize_rgb(rgb, style, (w, h), working_size=working_size), cv2.COLOR_RGB2BGR)
 
-    model_path = os.path.join(
-        os.path.dirname(__file__),
-        f"CartoonGAN_Test/pretrained_model/{style}_net_G_float.pth"
-    )
-    model = Transformer()
-    state = torch.load(model_path, map_location="cpu")
-    model.load_state_dict(state)
-    model.eval()
-    _model_cache[style] = model
-    return model
 
+def _cartoonize_rgb(rgb, style, out_size, net_size=(256, 256), working_size=None):
+    if working_size:
+        # tiled inference at the requested resolution instead of the 256x256 squash
+        model = load_cartoon_model(style)
+        stylized = stylize_rgb_tiled(lambda t: run_batched(("cartoon", style), model, t), rgb, working_size)
+        return cv2.resize(stylized, out_size)
 
+    with timed("preprocess"):
+        resized = cv2.resize(rgb, net_size)
 
-def cartoonize_foreground(img_bgr, mask, style="Hayao"):
+        input_tensor = (torch.from_numpy(resized).permute(2, 0, 1).float() / 127.5) - 1.0
+        input_tensor = input_tensor.unsqueeze(0)
+
+    model = load_cartoon_model(style)
+    out = run_batched(("cartoon", style), model, input_tensor)[0]
+    out = (out + 1) / 2.0  
+    out_np = out.permute(1, 2, 0).cpu().numpy()
+    out_np = (out_np * 255).astype(np.uint8)
+    return cv2.resize(out_np, out_size)
+
+
+def cartoonize_foreground(img_bgr, mask, style="Hayao", stylized_bgr=None, crop=False, max_side=512,
+                          working_size=None):
+    """
+    stylize the masked subject; with stylized_bgr (a cartoonize_full result)
+    the frame is only composited, no inference.
+    crop=True runs the network only on the padded mask bounding box, at a
+    working size that follows the crop (long side at most max_side).
+    working_size runs tiled inference at that long-side resolution instead.
+    """
 
 
     if len(mask.shape) == 3:
         mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
     _, mask_bin = cv2.threshold(mask, 128, 255, cv2.THRESH_BINARY)
 
+    if stylized_bgr is not None:
+        with timed("composite"):
+            return np.where(mask_bin[..., None] > 0, stylized_bgr, img_bgr)
 
-    fg = cv2.bitwise_and(img_bgr, img_bgr, mask=mask_bin)
+    h, w = img_bgr.shape[:2]
+    x0, y0, x1, y1 = 0, 0, w, h
+    net_size = (256, 256)
+    if crop:
+        box = mask_bbox(mask_bin)
+        if box is None:
+            return img_bgr.copy()
+        x0, y0, x1, y1 = box
+        net_size = crop_working_size(x1 - x0, y1 - y0, max_side=max_side)
+    region = img_bgr[y0:y1, x0:x1]
+    region_mask = mask_bin[y0:y1, x0:x1]
 
-    fg_rgb = cv2.cvtColor(fg, cv2.COLOR_BGR2RGB)
-    h, w = fg_rgb.shape[:2]
-    fg_resized = cv2.resize(fg_rgb, (256, 256))
 
-    input_tensor = (torch.from_numpy(fg_resized).permute(2, 0, 1).float() / 127.5) - 1.0
-    input_tensor = input_tensor.unsqueeze(0)
+    fg = cv2.bitwise_and(region, region, mask=region_mask)
 
-    model = load_cartoon_model(style)
-    with torch.no_grad():
-        out = model(input_tensor)[0]  
-    out = (out + 1) / 2.0  
-    out_np = out.permute(1, 2, 0).cpu().numpy()
-    out_np = (out_np * 255).astype(np.uint8)
-    stylized_rgb = cv2.resize(out_np, (w, h))
+    fg_rgb = cv2.cvtColor(fg, cv2.COLOR_BGR2RGB)
+    rh, rw = fg_rgb.shape[:2]
+    stylized_rgb = _cartoonize_rgb(fg_rgb, style, (rw, rh), net_size, working_size=working_size)
 
     stylized_bgr = cv2.cvtColor(stylized_rgb, cv2.COLOR_RGB2BGR)
-    inv_mask = cv2.bitwise_not(mask_bin)
-    background = cv2.bitwise_and(img_bgr, img_bgr, mask=inv_mask)
-    result = cv2.add(background, stylized_bgr)
+    with timed("composite"):
+        if crop:
+            # paste only the subject so the crop box leaves no seam
+            result = img_bgr.copy()
+            result[y0:y1, x0:x1] = np.where(region_mask[..., None] > 0, stylized_bgr, region)
+            return result
+
+        inv_mask = cv2.bitwise_not(region_mask)
+        background = cv2.bitwise_and(region, region, mask=inv_mask)
+        result = cv2.add(background, stylized_bgr)
 
     return result
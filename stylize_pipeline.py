@@ -0,0 +1,79 @@
+# stylize_pipeline.py
+#style dispatch shared by the web routes and the offline CLIs (batch_stylize,
+#video_stylize): which stylizer handles a style and part, and how a cached
+#whole frame is composited with a mask. Importing it builds no web app state.
+
+from stylize_back import cartoon_effect
+from stylize_front import cartoonize_foreground, cartoonize_full
+from animegan2_front import AnimeGANv2Front
+from animegan2_back import AnimeGANv2Back
+
+
+CARTOON_STYLES = ('Hayao', 'Shinkai', 'Hosoda', 'Paprika')
+
+# wrappers are cheap; their weights load on first use or in warm_up()
+animegan_front = AnimeGANv2Front("checkpoints/AnimeGANv2_best.pth")
+animegan_back = AnimeGANv2Back("checkpoints/AnimeGANv2_best.pth")
+
+
+def stylize_frame(img, style, stylePart, working_size=None, quality="full"):
+    """the mask-independent whole stylized frame that composite_frame blends in"""
+    if style in CARTOON_STYLES:
+        if stylePart == "foreground":
+            return cartoonize_full(img, style, working_size=working_size)
+        return cartoon_effect(img, None, style=style, working_size=working_size, quality=quality)
+    # the AnimeGAN foreground and background share one stylized frame
+    return animegan_back.stylize_full(img, working_size=working_size)
+
+
+def frame_key(image_hash, style, stylePart, working_size=None, quality="full"):
+    """frame_cache key of stylize_frame's result"""
+    if style in CARTOON_STYLES:
+        if stylePart == "foreground":
+            return (image_hash, style, "cartoonize", working_size)
+        return (image_hash, style, "cartoon_effect", working_size, quality)
+    return (image_hash, style, "animegan", working_size)
+
+
+def composite_frame(img, mask, frame, style, stylePart):
+    """blend a stylize_frame result into img inside (foreground) or outside (background) mask"""
+    if style in CARTOON_STYLES:
+        if stylePart == "foreground":
+            return cartoonize_foreground(img, mask, style=style, stylized_bgr=frame)
+        return cartoon_effect(img, mask, style=style, stylized_bgr=frame)
+    if stylePart == "foreground":
+        return animegan_front.stylize_foreground(img, mask, stylized_bgr=frame)
+    return animegan_back.stylize_background(img, mask, stylized_bgr=frame)
+
+
+def run_stylize(img, mask, style, stylePart, image_hash=None, full_frame=False, crop=False,
+                working_size=None, quality="full", frame_cache=None):
+    """
+    dispatch to the CartoonGAN or AnimeGAN foreground/background stylizer.
+    With image_hash and a frame_cache (FrameCache), mask-independent frames
+    come from the cache: always for the background, and for the foreground
+    when full_frame is set (whole-frame stylization instead of stylizing
+    the cut-out subject).
+    crop runs foreground inference on the subject's bounding box only.
+    working_size picks the inference resolution (long side, tiled) instead
+    of the default 256x256 resize. quality ("full", "balanced", "fast")
+    selects the cartoon_effect background pipeline.
+    """
+    use_frame = frame_cache is not None and image_hash is not None and \
+        (stylePart != "foreground" or full_frame)
+    ws = working_size
+
+    if use_frame:
+        frame = frame_cache.get_or_compute(
+            frame_key(image_hash, style, stylePart, ws, quality),
+            lambda: stylize_frame(img, style, stylePart, working_size=ws, quality=quality))
+        return composite_frame(img, mask, frame, style, stylePart)
+
+    if style in CARTOON_STYLES:
+        if stylePart == "foreground":
+            return cartoonize_foreground(img, mask, style=style, crop=crop, working_size=ws)
+        return cartoon_effect(img, mask, style=style, working_size=ws, quality=quality)
+
+    if stylePart == "foreground":
+        return animegan_front.stylize_foreground(img, mask, crop=crop, working_size=ws)
+    return animegan_back.stylize_background(img, mask, working_size=ws)
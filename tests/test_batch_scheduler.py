@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+import torch
+
+from batch_scheduler import InferenceBatcher
+
+
+class RecordingModel:
+    """doubles its input and remembers the batch size of every call"""
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, x):
+        with self._lock:
+            self.batches.append(x.shape[0])
+        if self.fail:
+            raise RuntimeError("forward failed")
+        return x * 2
+
+
+def run_concurrently(batcher, model, inputs):
+    results = [None] * len(inputs)
+    errors = [None] * len(inputs)
+    start = threading.Barrier(len(inputs))
+
+    def call(i):
+        start.wait()
+        try:
+            results[i] = batcher.run(("test",), model, inputs[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(inputs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert not any(t.is_alive() for t in threads)
+    return results, errors
+
+
+def test_concurrent_calls_share_one_forward():
+    batcher = InferenceBatcher(max_batch=4, max_wait_ms=500)
+    model = RecordingModel()
+    inputs = [torch.full((1, 3, 8, 8), float(i)) for i in range(4)]
+
+    results, errors = run_concurrently(batcher, model, inputs)
+
+    assert errors == [None] * 4
+    assert model.batches == [4]
+    for inp, out in zip(inputs, results):
+        assert out.shape == (1, 3, 8, 8)
+        assert torch.equal(out, inp * 2)
+
+
+def test_more_callers_than_max_batch_and_mixed_shapes():
+    batcher = InferenceBatcher(max_batch=4, max_wait_ms=20)
+    model = RecordingModel()
+    inputs = [torch.full((1, 3, 8 if i % 2 else 16, 8), float(i)) for i in range(11)]
+
+    results, errors = run_concurrently(batcher, model, inputs)
+
+    assert errors == [None] * 11
+    assert max(model.batches) <= 4
+    assert sum(model.batches) == 11
+    for inp, out in zip(inputs, results):
+        assert torch.equal(out, inp * 2)
+
+
+def test_error_reaches_every_caller():
+    batcher = InferenceBatcher(max_batch=3, max_wait_ms=500)
+    model = RecordingModel(fail=True)
+    inputs = [torch.zeros(1, 3, 4, 4) for _ in range(3)]
+
+    results, errors = run_concurrently(batcher, model, inputs)
+
+    assert results == [None] * 3
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_max_batch_one_runs_directly():
+    batcher = InferenceBatcher(max_batch=1)
+    model = RecordingModel()
+    out = batcher.run(("test",), model, torch.ones(1, 3, 4, 4))
+    assert model.batches == [1]
+    assert torch.equal(out, torch.full((1, 3, 4, 4), 2.0))
+
+    with pytest.raises(RuntimeError):
+        batcher.run(("test",), RecordingModel(fail=True), torch.ones(1, 3, 4, 4))
@@ -0,0 +1,55 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from batch_stylize import Task, run_pipeline, scan_directory
+
+
+def write_image(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, np.full((8, 10, 3), value, np.uint8))
+
+
+def invert(img, mask):
+    return 255 - img
+
+
+def test_same_stem_images_get_separate_outputs(tmp_path):
+    src, out = str(tmp_path / "in"), str(tmp_path / "out")
+    write_image(os.path.join(src, "a.jpg"), 10)
+    write_image(os.path.join(src, "a.png"), 200)
+    write_image(os.path.join(src, "b.png"), 50)
+    write_image(os.path.join(src, "sub", "c.bmp"), 90)
+
+    tasks = scan_directory(src, out)
+    outputs = sorted(os.path.relpath(t.output_path, out) for t in tasks)
+    assert outputs == ["a.jpg.png", "a.png.png", "b.png", os.path.join("sub", "c.png")]
+
+    progress = run_pipeline(tasks, invert, decode_workers=2, infer_workers=2, write_workers=2)
+    assert (progress.done, progress.skipped, progress.failed) == (4, 0, [])
+    assert cv2.imread(os.path.join(out, "a.png.png"))[0, 0, 0] == 55
+    assert cv2.imread(os.path.join(out, "a.jpg.png"))[0, 0, 0] == 255 - cv2.imread(
+        os.path.join(src, "a.jpg"))[0, 0, 0]
+
+    # a rerun resumes: every output exists, so nothing is redone
+    progress = run_pipeline(scan_directory(src, out), invert)
+    assert (progress.done, progress.skipped) == (0, 4)
+
+
+def test_duplicate_outputs_are_rejected(tmp_path):
+    out = str(tmp_path / "out.png")
+    tasks = [Task("a.jpg", None, out), Task("b.jpg", None, out)]
+    with pytest.raises(ValueError):
+        run_pipeline(tasks, invert)
+
+
+def test_failures_are_reported(tmp_path):
+    src, out = str(tmp_path / "in"), str(tmp_path / "out")
+    os.makedirs(src)
+    with open(os.path.join(src, "broken.png"), "wb") as f:
+        f.write(b"not an image")
+    progress = run_pipeline(scan_directory(src, out), invert)
+    assert progress.done == 0 and len(progress.failed) == 1
+    assert not os.path.exists(os.path.join(out, "broken.png"))
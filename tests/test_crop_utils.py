@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from crop_utils import mask_bbox, working_size
+
+
+def test_mask_bbox_pads_and_clips():
+    mask = np.zeros((100, 200), np.uint8)
+    mask[40:60, 50:150] = 255
+    # pad is 10% of the 100 pixel long side
+    assert mask_bbox(mask) == (40, 30, 160, 70)
+
+    mask[:] = 0
+    mask[0:5, 195:200] = 1
+    assert mask_bbox(mask) == (187, 0, 200, 13)
+
+
+def test_mask_bbox_of_empty_mask():
+    assert mask_bbox(np.zeros((10, 10), bool)) is None
+
+
+@pytest.mark.parametrize("w,h,expected", [
+    (1000, 500, (512, 256)),
+    (100, 50, (256, 128)),
+    (300, 301, (300, 300)),
+    (2000, 10, (512, 4)),
+])
+def test_working_size(w, h, expected):
+    size = working_size(w, h)
+    assert size == expected
+    assert all(v % 4 == 0 for v in size)
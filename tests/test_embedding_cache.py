@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+from sam_func import EmbeddingCache
+
+
+def entry(seed):
+    features = np.random.default_rng(seed).random((1, 8, 4, 4)).astype(np.float32)
+    return {"features": features, "original_size": (30, 40), "input_size": (24, 32)}
+
+
+def test_memory_lru_keeps_max_items():
+    cache = EmbeddingCache(max_items=2)
+    for key in "abc":
+        cache.put(key, entry(0))
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    stored = entry(1)
+    EmbeddingCache(max_items=1, cache_dir=str(tmp_path)).put("k", stored)
+
+    loaded = EmbeddingCache(max_items=1, cache_dir=str(tmp_path)).get("k")
+    assert np.array_equal(loaded["features"], stored["features"])
+    assert loaded["original_size"] == (30, 40)
+    assert loaded["input_size"] == (24, 32)
+    assert not [name for name in os.listdir(tmp_path) if ".tmp" in name]
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(max_items=1, cache_dir=str(tmp_path))
+    cache.put("a", entry(0))
+    size = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    cache.max_disk_bytes = int(size * 2.5)
+
+    os.utime(tmp_path / "a.npy", (1, 1))
+    cache.put("b", entry(1))
+    os.utime(tmp_path / "b.npy", (2, 2))
+    # a read from disk refreshes a, so b is the oldest when c arrives
+    cache.get("a")
+    cache.put("c", entry(2))
+
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "a.npy", "c.json", "c.npy"]
+    assert EmbeddingCache(cache_dir=str(tmp_path)).get("b") is None
@@ -0,0 +1,28 @@
+import threading
+import time
+
+import numpy as np
+
+from frame_cache import FrameCache
+
+
+def test_frame_cache_computes_concurrent_misses_once():
+    cache = FrameCache(max_bytes=10 ** 6)
+    calls = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return np.zeros((10, 10), np.uint8)
+
+    def get():
+        start.wait()
+        cache.get_or_compute("k", compute)
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
@@ -0,0 +1,35 @@
+import io
+import threading
+
+import cv2
+import numpy as np
+
+from image_store import ImageStore
+
+
+def test_image_store_decodes_once_and_notices_reuploads(tmp_path):
+    store = ImageStore()
+    path = str(tmp_path / "a.png")
+    image = np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    width, height, digest = store.save_upload(io.BytesIO(cv2.imencode(".png", image)[1].tobytes()), path)
+    assert (width, height) == (40, 30)
+
+    loaded = []
+    start = threading.Barrier(6)
+
+    def get():
+        start.wait()
+        loaded.append(store.get(path))
+
+    threads = [threading.Thread(target=get) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(s is loaded[0] for s in loaded)
+    assert loaded[0].digest == digest
+    assert np.array_equal(loaded[0].bgr, image)
+
+    smaller = image[:10, :20]
+    store.save_upload(io.BytesIO(cv2.imencode(".png", smaller)[1].tobytes()), path)
+    assert store.get(path).size == (20, 10)
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from job_queue import JobQueue
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.status(job_id)
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_queue_deduplicates_in_flight_and_finished_jobs():
+    queue = JobQueue(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def work(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    first, reused = queue.submit("k", work, 21)
+    assert not reused
+    second, reused = queue.submit("k", work, 21)
+    assert (second, reused) == (first, True)
+
+    release.set()
+    assert wait_for(queue, first)["result"] == 42
+    assert queue.submit("k", work, 21) == (first, True)
+    assert calls == [21]
+
+
+def test_job_queue_resubmits_failed_jobs_and_invalid_results():
+    results = {"ok": True}
+    queue = JobQueue(max_workers=1, result_valid=lambda r: results["ok"])
+
+    def fail():
+        raise ValueError("boom")
+
+    failed, _ = queue.submit("bad", fail)
+    assert wait_for(queue, failed)["status"] == "error"
+    retried, reused = queue.submit("bad", fail)
+    assert retried != failed and not reused
+
+    done, _ = queue.submit("good", lambda: "path")
+    wait_for(queue, done)
+    results["ok"] = False
+    again, reused = queue.submit("good", lambda: "path")
+    assert again != done and not reused
+
+
+def test_job_queue_trims_finished_jobs():
+    queue = JobQueue(max_workers=1, max_results=2)
+    ids = []
+    for i in range(4):
+        job_id, _ = queue.submit(i, lambda i=i: i)
+        wait_for(queue, job_id)
+        ids.append(job_id)
+    queue.submit("last", lambda: None)
+    assert queue.status(ids[0]) is None
+    assert queue.status(ids[-1]) is not None
@@ -0,0 +1,68 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from mask_codec import decode_mask, encode_mask, load_mask
+
+
+def sample_mask(seed=0, shape=(13, 17)):
+    return np.random.default_rng(seed).random(shape) > 0.5
+
+
+@pytest.mark.parametrize("fmt", ["rle", "bits"])
+@pytest.mark.parametrize("mask", [
+    sample_mask(),
+    np.ones((4, 5), bool),
+    np.zeros((4, 5), bool),
+    np.eye(6, dtype=bool),
+])
+def test_round_trip(fmt, mask):
+    encoded = json.loads(json.dumps(encode_mask(mask, fmt)))
+    assert encoded["format"] == fmt
+    assert np.array_equal(decode_mask(encoded), mask)
+
+
+def test_rle_starts_with_a_zero_run():
+    mask = np.array([[1, 1, 0, 1]], bool)
+    assert encode_mask(mask, "rle")["counts"] == [0, 2, 1, 1]
+
+
+def test_load_mask_references(tmp_path):
+    masks = [sample_mask(i) for i in range(3)]
+    json_path = str(tmp_path / "x_masks.json")
+    with open(json_path, "w") as f:
+        json.dump({"masks": [encode_mask(m, "rle") for m in masks]}, f)
+    npz_path = str(tmp_path / "x_masks.npz")
+    bits = np.packbits(np.stack(masks).reshape(3, -1), axis=1)
+    np.savez_compressed(npz_path, bits=bits, size=np.array(masks[0].shape))
+    png_path = str(tmp_path / "x_mask.png")
+    cv2.imwrite(png_path, masks[0].astype(np.uint8) * 255)
+
+    for i, m in enumerate(masks):
+        assert np.array_equal(load_mask(f"{json_path}#{i}"), m.astype(np.uint8) * 255)
+        assert np.array_equal(load_mask(f"{npz_path}#{i}"), m.astype(np.uint8) * 255)
+    assert np.array_equal(load_mask(png_path), masks[0].astype(np.uint8) * 255)
+    assert np.array_equal(load_mask(json_path), load_mask(f"{json_path}#0"))
+
+
+@pytest.mark.parametrize("suffix", ["#9", "#abc", "#-1"])
+def test_load_mask_bad_references(tmp_path, suffix):
+    json_path = str(tmp_path / "x_masks.json")
+    with open(json_path, "w") as f:
+        json.dump({"masks": [encode_mask(sample_mask(), "rle")]}, f)
+    npz_path = str(tmp_path / "x_masks.npz")
+    np.savez_compressed(npz_path, bits=np.packbits(sample_mask().reshape(1, -1), axis=1),
+                        size=np.array([13, 17]))
+
+    assert load_mask(json_path + suffix) is None
+    assert load_mask(npz_path + suffix) is None
+    assert load_mask(str(tmp_path / "missing.json#0")) is None
+
+
+def test_load_mask_truncated_file(tmp_path):
+    path = str(tmp_path / "x_masks.json")
+    with open(path, "w") as f:
+        f.write('{"masks": [{"size": [2')
+    assert load_mask(path + "#0") is None
@@ -0,0 +1,23 @@
+import time
+
+import numpy as np
+
+from mask_store import MaskStore
+
+
+def test_mask_store_round_trip_and_eviction():
+    store = MaskStore(ttl=600, max_items=2)
+    mask = np.zeros((5, 7), np.uint8)
+    mask[1:3, 2:6] = 255
+    first = store.put(mask)
+    assert np.array_equal(store.get(first), mask)
+
+    store.put(mask)
+    store.put(mask)
+    assert store.get(first) is None
+    assert len(store) == 2
+
+    expiring = MaskStore(ttl=0.01)
+    mask_id = expiring.put(mask)
+    time.sleep(0.05)
+    assert expiring.get(mask_id) is None
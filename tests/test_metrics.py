@@ -0,0 +1,49 @@
+from metrics import Metrics
+
+
+def test_render_histogram_counter_and_gauges():
+    m = Metrics(buckets=(0.1, 1.0))
+    m.describe("stage_seconds", "time per stage")
+    m.observe("stage_seconds", 0.05, stage="decode")
+    m.observe("stage_seconds", 0.5, stage="decode")
+    m.inc("lookups_total", cache="image", result="hit")
+    m.inc("lookups_total", 2, cache="image", result="hit")
+    m.gauge("store_bytes", lambda: 42, "bytes held")
+    m.gauge("model_bytes", lambda: [({"model": "sam"}, 7)])
+    m.gauge("broken", lambda: 1 / 0)
+
+    lines = m.render().splitlines()
+    assert lines[:7] == [
+        "# HELP stage_seconds time per stage",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="decode",le="0.1"} 1',
+        'stage_seconds_bucket{stage="decode",le="1.0"} 2',
+        'stage_seconds_bucket{stage="decode",le="+Inf"} 2',
+        'stage_seconds_sum{stage="decode"} 0.550000',
+        'stage_seconds_count{stage="decode"} 2',
+    ]
+    assert "# TYPE lookups_total counter" in lines
+    assert 'lookups_total{cache="image",result="hit"} 3' in lines
+    assert lines[-5:] == [
+        "# TYPE model_bytes gauge",
+        'model_bytes{model="sam"} 7',
+        "# HELP store_bytes bytes held",
+        "# TYPE store_bytes gauge",
+        "store_bytes 42",
+    ]
+    # a gauge that fails is left out rather than breaking the scrape
+    assert not any("broken" in line for line in lines)
+
+
+def test_render_escapes_label_values():
+    m = Metrics()
+    m.inc("errors_total", reason='bad "quote"\nnext')
+    assert 'errors_total{reason="bad \\"quote\\"\\nnext"} 1' in m.render().splitlines()
+
+
+def test_timed_records_an_observation():
+    m = Metrics()
+    with m.timed("inference", model="Generator"):
+        pass
+    count, total = m.snapshot()[("app_stage_seconds", (("model", "Generator"), ("stage", "inference")))]
+    assert count == 1 and total >= 0
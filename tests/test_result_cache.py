@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+
+from result_cache import ResultCache
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    cache = ResultCache(cache_dir=str(tmp_path), max_bytes=10 ** 9)
+    first = cache.put("a", image)
+    size = os.path.getsize(first)
+
+    cache.max_bytes = int(size * 2.5)
+    os.utime(first, (1, 1))
+    second = cache.put("b", image)
+    os.utime(second, (2, 2))
+    assert cache.get("a") == first  # refreshes a, so b is now the oldest
+    cache.put("c", image)
+
+    assert cache.get("a") == first
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert ResultCache.key("i", "m", "Hayao", "background", "1") == \
+        ResultCache.key("i", "m", "Hayao", "background", "1")
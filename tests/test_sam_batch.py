@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import torch
+
+segment_anything = pytest.importorskip("segment_anything")
+
+from sam_func import SAMImageState
+
+
+@pytest.fixture(scope="module")
+def state():
+    # random weights and a random embedding: only the decoder runs, so no
+    # checkpoint download and no image encoder pass
+    torch.manual_seed(0)
+    model = segment_anything.sam_model_registry["vit_b"](checkpoint=None).eval()
+    image = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    entry = {
+        "features": np.random.default_rng(1).standard_normal((1, 256, 64, 64)).astype(np.float32),
+        "original_size": (48, 64),
+        "input_size": (768, 1024),
+    }
+    return SAMImageState(model, image, entry, "cpu")
+
+
+def predict_one(state, prompt):
+    kwargs = {"multimask_output": True}
+    if prompt.get("points"):
+        kwargs["point_coords"] = np.array(prompt["points"])
+        kwargs["point_labels"] = np.array(prompt["labels"])
+    if prompt.get("box") is not None:
+        kwargs["box"] = np.array(prompt["box"])
+    with torch.inference_mode():
+        return state.predictor.predict(**kwargs)[:2]
+
+
+def test_segment_batch_matches_single_predict(state):
+    prompts = [
+        {"points": [[10, 12]], "labels": [1]},
+        {"points": [[40, 30], [5, 5]], "labels": [1, 0]},
+        {"box": [4, 6, 50, 40]},
+        {"points": [[30, 20]], "labels": [1]},
+        {"points": [[20, 20]], "labels": [0], "box": [0, 0, 63, 47]},
+    ]
+    with torch.inference_mode():
+        batched = state.segment_batch(prompts, max_batch=2)
+
+    assert len(batched) == len(prompts)
+    for prompt, (masks, scores) in zip(prompts, batched):
+        expected_masks, expected_scores = predict_one(state, prompt)
+        assert masks.shape == expected_masks.shape == (3, 48, 64)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-5)
+        # batching may flip a pixel that sits right on the threshold
+        assert np.mean(masks != expected_masks) < 1e-3
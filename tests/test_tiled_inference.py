@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import torch
+
+from sam_auto import tile_origins
+from tiled_inference import tiled_forward, working_shape
+
+
+@pytest.mark.parametrize("length,tile,overlap", [(100, 512, 64), (512, 512, 64), (1000, 512, 64), (1300, 512, 64)])
+def test_tile_origins_cover_the_length(length, tile, overlap):
+    starts = tile_origins(length, tile, overlap)
+    assert starts[0] == 0
+    assert starts[-1] == max(0, length - tile)
+    assert all(b - a <= tile - overlap for a, b in zip(starts, starts[1:]))
+
+
+def test_tiled_forward_blends_a_pointwise_model_exactly():
+    # a per-pixel model gives the same value in every overlapping tile, so
+    # the feathered blend must reproduce one full pass
+    inp = torch.rand(1, 3, 70, 90)
+
+    def model_fn(x):
+        return x * 2.0 - 1.0
+
+    out = tiled_forward(model_fn, inp, tile_size=32, overlap=8)
+    assert out.shape == (1, 3, 70, 90)
+    torch.testing.assert_close(out, model_fn(inp))
+
+
+def test_tiled_forward_single_pass_when_it_fits():
+    calls = []
+
+    def model_fn(x):
+        calls.append(tuple(x.shape))
+        return x
+
+    tiled_forward(model_fn, torch.rand(1, 3, 40, 50), tile_size=64, overlap=8)
+    assert calls == [(1, 3, 40, 50)]
+
+
+def test_tiled_forward_tiles_have_one_size():
+    shapes = set()
+
+    def model_fn(x):
+        shapes.add(tuple(x.shape[2:]))
+        return x
+
+    tiled_forward(model_fn, torch.rand(1, 3, 100, 45), tile_size=32, overlap=8)
+    assert shapes == {(32, 32)}
+
+
+@pytest.mark.parametrize("h,w,size,expected", [
+    (300, 400, 1024, (768, 1024)),
+    (1000, 250, 512, (512, 128)),
+    (33, 33, 60, (60, 60)),
+    (4000, 10, 512, (512, 4)),
+])
+def test_working_shape(h, w, size, expected):
+    shape = working_shape(h, w, size)
+    assert shape == expected
+    assert all(v % 4 == 0 for v in shape)
@@ -0,0 +1,305 @@
+# video_stylize.py
+#stylize a video frame by frame without holding the clip in memory:
+#frames stream from cv2.VideoCapture in small chunks, the chunk's frames go
+#through the network together, and results stream out through cv2.VideoWriter.
+#
+#  python video_stylize.py in.mp4 out.mp4 --style Hayao --stylePart background --points 320,240
+#  python video_stylize.py in.mp4 out.mp4 --style AnimeGAN --stylePart foreground --mask first_mask.png
+#
+#SAM only runs on keyframes; in between, the mask is carried along with
+#dense optical flow. Frames that barely differ from the last stylized one
+#reuse its stylized frame instead of running the network again.
+#The audio track is not copied.
+
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from batch_scheduler import inference_batcher
+from runtime_config import configure_threads
+
+FLOW_WIDTH = 320
+SIGNATURE_WIDTH = 160
+
+
+def small_gray(frame, width):
+    h, w = frame.shape[:2]
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+def frame_difference(a, b):
+    """mean absolute difference of two small grayscale signatures, in grey levels"""
+    return float(cv2.absdiff(a, b).mean())
+
+
+def changed_fraction(a, b, level=12):
+    """share of signature pixels that changed by more than level grey levels"""
+    return float((cv2.absdiff(a, b) > level).mean())
+
+
+def propagate_mask(mask, prev_gray, gray, max_samples=2000):
+    """
+    carry a 0/255 mask from the previous frame to the current one: fit a
+    similarity transform (shift, rotation, scale) to the Farneback flow of
+    the mask's interior at FLOW_WIDTH and warp the mask with it. Flow near
+    the outline is smeared into the background, so only the eroded interior
+    votes; non-rigid changes are picked up at the next SAM keyframe.
+    """
+    h, w = mask.shape[:2]
+    fh, fw = gray.shape[:2]
+    small = cv2.resize(mask, (fw, fh), interpolation=cv2.INTER_NEAREST)
+    interior = cv2.erode(small, np.ones((9, 9), np.uint8))
+    ys, xs = np.nonzero(interior >= 128)
+    if len(xs) < 10:
+        ys, xs = np.nonzero(small >= 128)
+    if len(xs) == 0:
+        return mask
+    if len(xs) > max_samples:
+        pick = np.random.default_rng(0).choice(len(xs), max_samples, replace=False)
+        ys, xs = ys[pick], xs[pick]
+
+    flow = cv2.calcOpticalFlowFarneback(prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    src = np.stack([xs, ys], axis=1).astype(np.float32)
+    dst = src + flow[ys, xs]
+    matrix, _ = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=1.0)
+    if matrix is None:
+        shift = np.median(dst - src, axis=0)
+        matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+    # the transform was fitted at flow resolution; rescale its translation
+    matrix = matrix.astype(np.float32)
+    matrix[0, 2] *= w / fw
+    matrix[1, 2] *= h / fh
+    return cv2.warpAffine(mask, matrix, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+
+
+def mask_prompt(mask):
+    """box and one positive point (the most interior pixel) describing a mask, or None"""
+    if not mask.any():
+        return None
+    x, y, w, h = cv2.boundingRect((mask > 0).astype(np.uint8))
+    dist = cv2.distanceTransform((mask > 0).astype(np.uint8), cv2.DIST_L2, 3)
+    py, px = np.unravel_index(int(dist.argmax()), dist.shape)
+    return [x, y, x + w, y + h], [[int(px), int(py)]], [1]
+
+
+class MaskTracker:
+    """
+    Mask for every frame of a video. SAM segments keyframes (the first
+    frame from the user's prompt, later ones from the propagated mask's
+    box and interior point); other frames take the previous mask warped
+    by optical flow.
+    """
+    def __init__(self, segmentor=None, points=None, labels=None, box=None, mask=None,
+                 keyframe_interval=30, scene_cut=40.0):
+        self.segmentor = segmentor
+        self.points = points
+        self.labels = labels
+        self.box = box
+        self.initial_mask = mask
+        self.keyframe_interval = keyframe_interval
+        self.scene_cut = scene_cut
+        self.mask = None
+        self.prev_gray = None
+        self.since_keyframe = 0
+        self.keyframes = 0
+
+    def _segment(self, frame, index, box, points, labels):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        state = self.segmentor.state_for_array(rgb, f"video-frame-{id(self)}-{index}")
+        if box is not None:
+            masks, scores = state.segment_with_box_and_points(box, points, labels)
+        else:
+            masks, scores = state.segment_all_masks(points, labels)
+        self.keyframes += 1
+        return masks[int(np.argmax(scores))].astype(np.uint8) * 255
+
+    def next(self, frame, index):
+        gray = small_gray(frame, FLOW_WIDTH)
+        if self.mask is None:
+            if self.initial_mask is not None:
+                h, w = frame.shape[:2]
+                mask = cv2.resize(self.initial_mask, (w, h), interpolation=cv2.INTER_NEAREST)
+            else:
+                mask = self._segment(frame, index, self.box, self.points, self.labels)
+            self.since_keyframe = 0
+        else:
+            cut = frame_difference(gray, self.prev_gray) > self.scene_cut
+            mask = propagate_mask(self.mask, self.prev_gray, gray)
+            self.since_keyframe += 1
+            if self.segmentor is not None and (cut or self.since_keyframe >= self.keyframe_interval):
+                prompt = mask_prompt(mask)
+                if prompt is not None:
+                    mask = self._segment(frame, index, *prompt)
+                self.since_keyframe = 0
+        self.mask = np.where(mask >= 128, 255, 0).astype(np.uint8)
+        self.prev_gray = gray
+        return self.mask
+
+
+def read_chunks(capture, size):
+    """yield lists of up to size frames from an open VideoCapture"""
+    chunk = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        chunk.append(frame)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stylize_video(input_path, output_path, style="Hayao", stylePart="background", tracker=None,
+                  batch=4, dup_threshold=0.0005, working_size=None, quality="full", fourcc="mp4v",
+                  report_every=5.0):
+    """
+    stream input_path through the stylizer into output_path.
+    batch frames are read at a time and their network passes run
+    concurrently, so the shared inference batcher can stack them.
+    :return: stats dict (frames, inferred, reused, keyframes, seconds)
+    """
+    from stylize_pipeline import stylize_frame, composite_frame
+
+    capture = cv2.VideoCapture(input_path)
+    if not capture.isOpened():
+        raise ValueError(f"cannot open video: {input_path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        raise ValueError(f"cannot open video writer: {output_path}")
+
+    # encoding runs on its own thread; the bounded queue keeps memory flat
+    out_queue = queue.Queue(maxsize=batch * 2)
+
+    def write_loop():
+        while True:
+            frame = out_queue.get()
+            if frame is None:
+                return
+            writer.write(frame)
+
+    write_thread = threading.Thread(target=write_loop, name="video-write", daemon=True)
+    write_thread.start()
+    pool = ThreadPoolExecutor(max_workers=batch, thread_name_prefix="video-infer")
+
+    stats = {"frames": 0, "inferred": 0, "reused": 0, "keyframes": 0}
+    last_signature, last_stylized = None, None
+    start = last_report = time.perf_counter()
+    index = 0
+    try:
+        for chunk in read_chunks(capture, batch):
+            # pick the frames that need the network; near-duplicates point at
+            # the most recent stylized frame instead
+            sources, pending = [], []
+            for frame in chunk:
+                signature = small_gray(frame, SIGNATURE_WIDTH)
+                if last_signature is not None and changed_fraction(signature, last_signature) < dup_threshold:
+                    sources.append(len(pending) - 1 if pending else -1)
+                else:
+                    pending.append(frame)
+                    sources.append(len(pending) - 1)
+                    last_signature = signature
+            stylized = list(pool.map(
+                lambda f: stylize_frame(f, style, stylePart, working_size=working_size, quality=quality),
+                pending))
+            stats["inferred"] += len(pending)
+            stats["reused"] += len(chunk) - len(pending)
+
+            for frame, source in zip(chunk, sources):
+                frame_stylized = stylized[source] if source >= 0 else last_stylized
+                if tracker is not None:
+                    mask = tracker.next(frame, index)
+                else:
+                    # no mask: the whole frame is the stylized part
+                    fill = 255 if stylePart == "foreground" else 0
+                    mask = np.full(frame.shape[:2], fill, np.uint8)
+                out_queue.put(composite_frame(frame, mask, frame_stylized, style, stylePart))
+                index += 1
+            if stylized:
+                last_stylized = stylized[-1]
+
+            stats["frames"] = index
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                last_report = now
+                of_total = f"/{total}" if total else ""
+                print(f"{index}{of_total} frames, {index / (now - start):.2f} fps, "
+                      f"{stats['reused']} reused", flush=True)
+    finally:
+        out_queue.put(None)
+        write_thread.join()
+        writer.release()
+        capture.release()
+        pool.shutdown()
+
+    stats["keyframes"] = tracker.keyframes if tracker is not None else 0
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def parse_points(spec):
+    return [[int(v) for v in p.split(",")] for p in spec.split(";") if p]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stylize a video")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--style", default="Hayao", help="CartoonGAN style or AnimeGAN")
+    parser.add_argument("--stylePart", default="background", choices=["foreground", "background"])
+    parser.add_argument("--points", default=None, help="SAM prompt on the first frame: 'x,y;x,y'")
+    parser.add_argument("--labels", default=None, help="1/0 per point, e.g. '1,0' (default all 1)")
+    parser.add_argument("--box", default=None, help="SAM box prompt on the first frame: 'x0,y0,x1,y1'")
+    parser.add_argument("--mask", default=None, help="mask image for the first frame instead of SAM")
+    parser.add_argument("--keyframe-interval", type=int, default=30,
+                        help="re-run SAM every N frames (and on scene cuts)")
+    parser.add_argument("--dup-threshold", type=float, default=0.0005,
+                        help="share of changed pixels below which a frame reuses the last stylized one "
+                             "(0 disables reuse)")
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--working-size", type=int, default=None)
+    parser.add_argument("--quality", default="full", choices=["full", "balanced", "fast"])
+    parser.add_argument("--fourcc", default="mp4v")
+    args = parser.parse_args()
+
+    configure_threads()
+    inference_batcher.max_batch = args.batch
+
+    tracker = None
+    if args.mask:
+        initial = cv2.imread(args.mask, 0)
+        if initial is None:
+            parser.error(f"cannot read mask: {args.mask}")
+        tracker = MaskTracker(mask=initial, keyframe_interval=args.keyframe_interval)
+        if args.points or args.box:
+            parser.error("use either --mask or --points/--box")
+    elif args.points or args.box:
+        from sam_func import SAMSegmentor
+        points = parse_points(args.points) if args.points else None
+        labels = [int(v) for v in args.labels.split(",")] if args.labels else (
+            [1] * len(points) if points else None)
+        box = [int(v) for v in args.box.split(",")] if args.box else None
+        tracker = MaskTracker(SAMSegmentor(cache_size=1), points=points, labels=labels, box=box,
+                              keyframe_interval=args.keyframe_interval)
+
+    stats = stylize_video(
+        args.input, args.output, style=args.style, stylePart=args.stylePart, tracker=tracker,
+        batch=args.batch, dup_threshold=args.dup_threshold, working_size=args.working_size,
+        quality=args.quality, fourcc=args.fourcc,
+    )
+    print(f"{stats['frames']} frames in {stats['seconds']:.1f}s "
+          f"({stats['frames'] / max(stats['seconds'], 1e-9):.2f} fps): "
+          f"{stats['inferred']} stylized, {stats['reused']} reused, {stats['keyframes']} SAM keyframes")